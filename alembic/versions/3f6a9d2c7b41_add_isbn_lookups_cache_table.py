@@ -0,0 +1,33 @@
+"""Add isbn_lookups cache table
+
+Revision ID: 3f6a9d2c7b41
+Revises: cbc1a6c1b104
+Create Date: 2026-10-17 13:05:11.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6a9d2c7b41'
+down_revision: Union[str, None] = 'cbc1a6c1b104'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'isbn_lookups',
+        sa.Column('isbn', sa.String(), nullable=False),
+        sa.Column('found', sa.Boolean(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('fetched_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('isbn'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('isbn_lookups')
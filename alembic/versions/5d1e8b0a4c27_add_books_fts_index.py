@@ -0,0 +1,32 @@
+"""Add books_fts full-text index
+
+Revision ID: 5d1e8b0a4c27
+Revises: 3f6a9d2c7b41
+Create Date: 2026-10-17 14:21:37.905126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from books.models import BOOKS_FTS_DDL_V1 as BOOKS_FTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1e8b0a4c27'
+down_revision: Union[str, None] = '3f6a9d2c7b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for statement in BOOKS_FTS_DDL:
+        op.execute(statement)
+    # Backfill the index from the books already in the library
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+    op.execute("DROP TABLE IF EXISTS books_fts")
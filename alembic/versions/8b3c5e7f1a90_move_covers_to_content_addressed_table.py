@@ -0,0 +1,69 @@
+"""Move covers to content-addressed covers table
+
+Revision ID: 8b3c5e7f1a90
+Revises: 5d1e8b0a4c27
+Create Date: 2026-10-17 15:02:48.317640
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from books.models import BOOKS_FTS_DDL_V1 as BOOKS_FTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b3c5e7f1a90'
+down_revision: Union[str, None] = '5d1e8b0a4c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'covers',
+        sa.Column('sha256', sa.String(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+    op.add_column('books', sa.Column('cover_hash', sa.String(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text('SELECT id, cover FROM books WHERE cover IS NOT NULL')
+    )
+    for book_id, cover in rows.fetchall():
+        cover_hash = hashlib.sha256(cover).hexdigest()
+        connection.execute(
+            sa.text('INSERT OR IGNORE INTO covers (sha256, data) VALUES (:sha256, :data)'),
+            {'sha256': cover_hash, 'data': cover},
+        )
+        connection.execute(
+            sa.text('UPDATE books SET cover_hash = :sha256 WHERE id = :id'),
+            {'sha256': cover_hash, 'id': book_id},
+        )
+
+    # SQLite recreates the table to drop a column, which also drops its triggers
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_column('cover')
+        batch_op.create_foreign_key(
+            'fk_books_cover_hash', 'covers', ['cover_hash'], ['sha256']
+        )
+    for statement in BOOKS_FTS_DDL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.add_column(sa.Column('cover', sa.LargeBinary(), nullable=True))
+    op.execute(
+        'UPDATE books SET cover = '
+        '(SELECT data FROM covers WHERE covers.sha256 = books.cover_hash)'
+    )
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_constraint('fk_books_cover_hash', type_='foreignkey')
+        batch_op.drop_column('cover_hash')
+    for statement in BOOKS_FTS_DDL:
+        op.execute(statement)
+    op.drop_table('covers')
@@ -0,0 +1,27 @@
+"""Add telegram_file_id to covers
+
+Revision ID: a4e2f9c6d813
+Revises: 8b3c5e7f1a90
+Create Date: 2026-10-17 15:40:09.551204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e2f9c6d813'
+down_revision: Union[str, None] = '8b3c5e7f1a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('covers', sa.Column('telegram_file_id', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('covers') as batch_op:
+        batch_op.drop_column('telegram_file_id')
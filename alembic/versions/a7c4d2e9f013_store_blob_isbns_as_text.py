@@ -0,0 +1,51 @@
+"""Store ISBNs saved as blobs as text
+
+Revision ID: a7c4d2e9f013
+Revises: d8e3f5a1c6b2
+Create Date: 2026-10-18 10:12:40.318562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c4d2e9f013'
+down_revision: Union[str, None] = 'd8e3f5a1c6b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    # Early books were saved with the scanned bytes as ISBN, which never equal
+    # the text ISBNs duplicate checks compare, so some were shelved twice
+    duplicates = connection.execute(
+        sa.text(
+            "SELECT legacy.id, copy.id, copy.cover_hash FROM books AS legacy "
+            "JOIN books AS copy ON copy.isbn = CAST(legacy.isbn AS TEXT) "
+            "WHERE typeof(legacy.isbn) = 'blob' AND typeof(copy.isbn) = 'text'"
+        )
+    ).fetchall()
+    for legacy_id, copy_id, cover_hash in duplicates:
+        # The first copy is kept, with the cover of the second if it had none
+        connection.execute(
+            sa.text(
+                'UPDATE books SET cover_hash = :cover_hash '
+                'WHERE id = :id AND cover_hash IS NULL'
+            ),
+            {'cover_hash': cover_hash, 'id': legacy_id},
+        )
+        connection.execute(
+            sa.text('DELETE FROM enrichment_jobs WHERE book_id = :id'), {'id': copy_id}
+        )
+        connection.execute(sa.text('DELETE FROM books WHERE id = :id'), {'id': copy_id})
+
+    op.execute("UPDATE books SET isbn = CAST(isbn AS TEXT) WHERE typeof(isbn) = 'blob'")
+
+
+def downgrade() -> None:
+    # Which ISBNs were blobs is not kept, and text is what they should be
+    pass
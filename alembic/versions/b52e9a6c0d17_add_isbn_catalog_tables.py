@@ -0,0 +1,47 @@
+"""Add isbn_catalog and catalog_authors tables
+
+Revision ID: b52e9a6c0d17
+Revises: f1c4b7e9d352
+Create Date: 2026-10-17 22:40:18.660214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52e9a6c0d17'
+down_revision: Union[str, None] = 'f1c4b7e9d352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'isbn_catalog',
+        sa.Column('isbn', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('author_keys', sa.String(), nullable=True),
+        sa.Column('by_statement', sa.String(), nullable=True),
+        sa.Column('year', sa.Integer(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('source_key', sa.String(), nullable=True),
+        sa.Column('last_modified', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('isbn'),
+        sqlite_with_rowid=False,
+    )
+    op.create_table(
+        'catalog_authors',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('last_modified', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+        sqlite_with_rowid=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('catalog_authors')
+    op.drop_table('isbn_catalog')
@@ -0,0 +1,30 @@
+"""Add cover_id to isbn_catalog
+
+Revision ID: c5f2e8a1d694
+Revises: e6b1c9d4a270
+Create Date: 2026-10-17 23:58:41.304927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f2e8a1d694'
+down_revision: Union[str, None] = 'e6b1c9d4a270'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled in the next time the editions dump is loaded
+    op.add_column('isbn_catalog', sa.Column('cover_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table(
+        'isbn_catalog', table_kwargs={'sqlite_with_rowid': False}
+    ) as batch_op:
+        batch_op.drop_column('cover_id')
@@ -0,0 +1,32 @@
+"""Add conversation_state table
+
+Revision ID: c7d2a1e5f384
+Revises: a4e2f9c6d813
+Create Date: 2026-10-17 17:02:31.118420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2a1e5f384'
+down_revision: Union[str, None] = 'a4e2f9c6d813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'conversation_state',
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('conversation_state')
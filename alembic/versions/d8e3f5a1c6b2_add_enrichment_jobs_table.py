@@ -0,0 +1,44 @@
+"""Add enrichment_jobs table
+
+Revision ID: d8e3f5a1c6b2
+Revises: b52e9a6c0d17
+Create Date: 2026-10-17 23:31:52.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e3f5a1c6b2'
+down_revision: Union[str, None] = 'b52e9a6c0d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'enrichment_jobs',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('isbn', sa.String(), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=True),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt', sa.Float(), nullable=False),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id'),
+    )
+    op.create_index(
+        op.f('ix_enrichment_jobs_next_attempt'),
+        'enrichment_jobs',
+        ['next_attempt'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_enrichment_jobs_next_attempt'), table_name='enrichment_jobs')
+    op.drop_table('enrichment_jobs')
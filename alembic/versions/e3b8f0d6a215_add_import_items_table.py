@@ -0,0 +1,34 @@
+"""Add import_items table
+
+Revision ID: e3b8f0d6a215
+Revises: c7d2a1e5f384
+Create Date: 2026-10-17 18:21:47.530612
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8f0d6a215'
+down_revision: Union[str, None] = 'c7d2a1e5f384'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'import_items',
+        sa.Column('job', sa.String(), nullable=False),
+        sa.Column('line', sa.Integer(), nullable=False),
+        sa.Column('isbn', sa.String(), nullable=False),
+        sa.Column('box_name', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('job', 'line'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_items')
@@ -0,0 +1,49 @@
+"""Recompute search keys without soft and hard signs
+
+Revision ID: e6b1c9d4a270
+Revises: a7c4d2e9f013
+Create Date: 2026-10-18 11:05:27.641093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from books.search import book_keys
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b1c9d4a270'
+down_revision: Union[str, None] = 'a7c4d2e9f013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def backfill():
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text('SELECT id, title, author, description FROM books')
+    ).fetchall()
+    if rows:
+        connection.execute(
+            sa.text(
+                'UPDATE books SET title_key = :title_key, author_key = :author_key, '
+                'description_key = :description_key WHERE id = :id'
+            ),
+            [
+                {'id': row.id, **book_keys(row.title, row.author, row.description)}
+                for row in rows
+            ],
+        )
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    op.execute("INSERT INTO books_trigram(books_trigram) VALUES ('rebuild')")
+
+
+def upgrade() -> None:
+    # Keys used to split words at ь and ъ, "большой" was stored as "bol shoj"
+    backfill()
+
+
+def downgrade() -> None:
+    # The old keys only differed by those splits, the new ones work as well
+    pass
@@ -0,0 +1,71 @@
+"""Add search keys to books and a trigram index
+
+Revision ID: f1c4b7e9d352
+Revises: e3b8f0d6a215
+Create Date: 2026-10-17 21:12:05.481337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from books.models import BOOKS_FTS_DDL, BOOKS_FTS_DDL_V1, BOOKS_TRIGRAM_DDL
+from books.search import book_keys
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c4b7e9d352'
+down_revision: Union[str, None] = 'e3b8f0d6a215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def drop_fts():
+    for name in ('books_fts_au', 'books_fts_ad', 'books_fts_ai'):
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS books_fts')
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('title_key', sa.String(), nullable=True))
+    op.add_column('books', sa.Column('author_key', sa.String(), nullable=True))
+    op.add_column('books', sa.Column('description_key', sa.String(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text('SELECT id, title, author, description FROM books')
+    ).fetchall()
+    if rows:
+        connection.execute(
+            sa.text(
+                'UPDATE books SET title_key = :title_key, author_key = :author_key, '
+                'description_key = :description_key WHERE id = :id'
+            ),
+            [
+                {'id': row.id, **book_keys(row.title, row.author, row.description)}
+                for row in rows
+            ],
+        )
+
+    # The index moves from the raw text to the keys
+    drop_fts()
+    for statement in BOOKS_FTS_DDL + BOOKS_TRIGRAM_DDL:
+        op.execute(statement)
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    op.execute("INSERT INTO books_trigram(books_trigram) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    for name in ('books_trigram_au', 'books_trigram_ad', 'books_trigram_ai'):
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS books_trigram')
+    drop_fts()
+
+    # SQLite recreates the table to drop a column, which also drops its triggers
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_column('description_key')
+        batch_op.drop_column('author_key')
+        batch_op.drop_column('title_key')
+    for statement in BOOKS_FTS_DDL_V1:
+        op.execute(statement)
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
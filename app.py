@@ -1,18 +1,23 @@
 #!/usr/bin/env python
 
+import asyncio
 import html
 import json
 import logging
 import re
+import tempfile
+import time
 import traceback
 import uuid
 from io import BytesIO
+from urllib.parse import urlsplit
 
 
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaPhoto,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
     Update,
@@ -24,27 +29,33 @@ from telegram.ext import (
     ContextTypes,
     MessageHandler,
     ConversationHandler,
-    PicklePersistence,
     filters,
 )
 
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from dataclasses import dataclass
+import httpx
+import isbnlib
 from books.models import Book, Box, Base
-
-from sqlalchemy.orm import joinedload
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
+from books.database import AsyncDatabaseHandler, DatabaseHandler
+from books.metadata import MetadataClient, cover_url
+from books.cache import IsbnCache, normalize_isbn
+from books.catalog import IsbnCatalog
+from books.providers import default_client
+from books.covers import CoverFetcher
+from books.enrichment import Enricher
+from books.importer import Importer, summary
+from books.export import FORMATS
+from books.barcode import BarcodeDecoder, DecoderBusy, barcodes
+from books.outbound import MESSAGE_LIMIT, SendScheduler, bulk_output
+from books.conversation import KeyedApplication, shelving_state
+from books.persistence import DatabasePersistence
+from books.metrics import REGISTRY, MetricsServer, instrument_handlers
 
 # from telegram_handler import TelegramLoggingHandler
-import cv2
-from pyzbar.pyzbar import decode
-import urllib.request
-from transliterate import translit
 
 
 # Enable logging
@@ -64,18 +75,13 @@ from functools import wraps
 LIST_OF_ADMINS = [176502779, 445937181]
 
 
-# Function to transliterate Russian text to English
-def transliterate_russian_to_english(text):
-    return translit(text, "ru", reversed=True)
-
-
 def restricted_method(func):
     @wraps(func)
     async def wrapped(instance, update, context, *args, **kwargs):
         user_id = update.effective_user.id
         if user_id not in LIST_OF_ADMINS:
             logger.warn(f"Unauthorized access denied for {user_id}.")
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "Sorry, this bot is not ready for production yet ¯\_(ツ)_/¯."
             )
             return
@@ -84,142 +90,38 @@ def restricted_method(func):
     return wrapped
 
 
-def barcode(image):
-    # read the image in numpy array using cv2
-    img = cv2.imread(image)
-
-    # Decode the barcode image
-    detectedBarcodes = decode(img)
-
-    # If not detected then print the message
-    if not detectedBarcodes:
-        print("Barcode Not Detected or your barcode is blank/corrupted!")
-    else:
-        # Traverse through all the detected barcodes in image
-        for barcode in detectedBarcodes:
-            # Locate the barcode position in image
-            (x, y, w, h) = barcode.rect
-
-            # Put the rectangle in image using
-            # cv2 to highlight the barcode
-            cv2.rectangle(
-                img, (x - 10, y - 10), (x + w + 10, y + h + 10), (255, 0, 0), 2
-            )
-
-            if barcode.data != "":
-                # Print the barcode data
-                logger.info("Barcode on %s is: %s", image, barcode.data)
-                cv2.imwrite(image, img)
-                return barcode.data, image
-
-
-def isbn_db(isbn):
-    base_api_link = "https://www.googleapis.com/books/v1/volumes?q=isbn:"
-    url = f"{base_api_link}{isbn}&country=RU"
-    request = urllib.request.Request(url, data=None)
-    with urllib.request.urlopen(request) as f:
-        text = f.read()
-
-    decoded_text = text.decode("utf-8")
-    return json.loads(decoded_text)
-
-
 async def downloader(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Download file
-    new_file = await update.message.effective_attachment[-1].get_file()
-    file = await new_file.download_to_drive()
-
-    return file
+    return await download(update.message.effective_attachment[-1])
 
 
-BOX, ADD_BOX, DESCRIPTION, COVER = range(4)
+async def download(attachment):
+    # Download file into memory, nothing is written to disk
+    new_file = await attachment.get_file()
+    photo = await new_file.download_as_bytearray()
 
+    return photo
 
-class DatabaseHandler:
-    def __init__(self, database_url):
-        self.engine = create_engine(database_url)
-        Base.metadata.bind = self.engine
-        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
 
-    def read_boxes(self):
-        boxes = []
-        with self.Session() as session:
-            boxes = session.query(Box).all()
-            session.expunge_all()
+BOX, ADD_BOX, DESCRIPTION, COVER = range(4)
 
-        return boxes
+# Search results shown per message, also the media group size limit
+PAGE_SIZE = 10
 
-    def create_box(self, new_box_name):
-        with self.Session() as session:
-            new_box = Box(name_of_the_box=new_box_name)
-            session.add(new_box)
-            session.commit()
+# Bot API limit for uploading a document
+UPLOAD_LIMIT = 50 * 1024 * 1024
 
-    def create_book(self, title, isbn, author, year, description, box):
-        new_book = Book(
-            title=title,
-            isbn=isbn,  # TODO check the same
-            author=author,
-            year=year,
-            description=description,
-            box=box,
-        )
-        with self.Session() as session:
-            try:
-                session.add(new_book)
-                session.commit()
-
-            except IntegrityError:
-                logger.error("The book already exists, %s, %s", title, isbn)
-
-        with self.Session() as session:
-            # Retrieve the persisted instance with eager loading of 'box'
-            persisted_book = (
-                session.query(Book)
-                .options(joinedload(Book.box))
-                .filter_by(isbn=new_book.isbn)
-                .first()
-            )
-            session.expunge_all()
-
-        return persisted_book
-
-    def add_image_to_book(self, book, cover_binary):
-        with self.Session() as session:
-            book = session.query(Book).filter_by(id=book.id).first()
-            if book:
-                book.cover = cover_binary
-                session.commit()
-
-    def search_books_by_keyword(self, keyword):
-        with self.Session() as session:
-            # Using ilike for case-insensitive search
-            query = (
-                session.query(Book)
-                .options(joinedload(Book.box))
-                .filter(
-                    or_(
-                        Book.title.ilike(f"%{keyword}%"),
-                        Book.author.ilike(f"%{keyword}%"),
-                        Book.description.ilike(f"%{keyword}%"),
-                    )
-                )
-                .all()
-            )
-            return query
+# Photos of an album arrive as separate updates, wait this long for the rest
+ALBUM_WAIT = 1.0
 
-    def books_in_box(self, box_name):
-        logger.info(f"Find in box named: {box_name}")
+# Seconds between passes over the enrichment queue, retries become due in between
+ENRICH_INTERVAL = 30
 
-        with self.Session() as session:
-            box = session.query(Box).filter_by(name_of_the_box=box_name).first()
-            if box:
-                books = session.query(Book).filter_by(box=box).all()
-                return books
-            else:
-                return []
+# A scan's lookup waits this long for its acknowledgement to be sent and
+# recorded, so the result edits that message instead of arriving before it
+ACK_WAIT = 60
 
 
+@bulk_output
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the developer."""
     # Log the error before we do anything else, so we can see it even if something breaks.
@@ -251,20 +153,52 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 class BookShelfBot:
-    box: Box
     new_box_caption = "Add new box"
 
-    def __init__(self, token, db_handler):
+    def __init__(
+        self, token, db_handler, metadata_client=None, decoder=None, metrics_port=None
+    ):
         self.token = token
-        # TODO here we will read boxes
-        self.book = Book
         self.db_handler = db_handler
-
-    def run(self):
-        persistence = PicklePersistence(filepath="conversationbot")
-        application = (
-            Application.builder().token(token).build()
-        )  # .persistence(persistence).build()
+        self.metadata_client = metadata_client or MetadataClient()
+        self.decoder = decoder or BarcodeDecoder()
+        self.metrics = MetricsServer(port=metrics_port) if metrics_port else None
+        self.covers = CoverFetcher()
+        self.enricher = Enricher(db_handler, self.metadata_client, self.covers)
+        self._albums = {}
+
+    async def post_init(self, application: Application) -> None:
+        if self.metrics:
+            await self.metrics.start()
+        await self.decoder.start()
+
+    async def post_shutdown(self, application: Application) -> None:
+        if self.metrics:
+            await self.metrics.stop()
+        await self.metadata_client.aclose()
+        await self.covers.aclose()
+        self.decoder.shutdown()
+        self.db_handler.shutdown()
+
+    def build_application(self, request=None, rate_limiter=None) -> Application:
+        """Wire up the Application, `request` replaces the Bot API connection."""
+        # Only sessions that changed are written, so flushing often is cheap
+        persistence = DatabasePersistence(self.db_handler.Session, update_interval=5)
+        rate_limiter = rate_limiter or SendScheduler()
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .application_class(KeyedApplication)
+            # Each user's updates stay in order, different users run in parallel
+            .concurrent_updates(True)
+            .rate_limiter(rate_limiter)
+            .persistence(persistence)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if request:
+            builder = builder.request(request).get_updates_request(request)
+        application = builder.build()
 
         # TODO split to box and book?
         conv_handler = ConversationHandler(
@@ -294,23 +228,139 @@ class BookShelfBot:
                 CommandHandler("exit", self.cancel),
             ],
             name="conversation",
-            # persistent=True,
+            persistent=True,
         )
 
         application.add_handler(conv_handler)
         application.add_handler(CommandHandler("book", self.find_book))
         application.add_handler(CommandHandler("find", self.find_book))
+        application.add_handler(CallbackQueryHandler(self.find_page, pattern="^find:"))
         application.add_handler(CommandHandler("box", self.books_by_box))
+        application.add_handler(CommandHandler("import", self.import_isbns))
+        application.add_handler(CommandHandler("export", self.export))
+        application.add_handler(
+            MessageHandler(
+                filters.Document.ALL & filters.CaptionRegex(r"^/import"),
+                self.import_isbns,
+            )
+        )
 
         # ...and the error handler
         application.add_error_handler(error_handler)
 
-        application.run_polling()
+        # Scans are kicked off right away, this also picks up retries and the
+        # jobs a restart left behind
+        application.job_queue.run_repeating(
+            self.enrich, interval=ENRICH_INTERVAL, first=1, name="enrich"
+        )
+
+        instrument_handlers(application)
+        self.register_metrics(application, rate_limiter, persistence)
+        return application
+
+    def register_metrics(self, application, rate_limiter, persistence):
+        """Queue depths and the stats the components already count, read on scrape."""
+        REGISTRY.gauge(
+            "bookshelf_update_queue_depth",
+            "Updates received but not yet picked up",
+            func=application.update_queue.qsize,
+        )
+        REGISTRY.gauge(
+            "bookshelf_decoder_queue_depth",
+            "Photos waiting for a barcode worker",
+            func=lambda: self.decoder.queue_depth,
+        )
+        REGISTRY.gauge(
+            "bookshelf_db_pending",
+            "Database calls running or waiting for a thread",
+            func=lambda: getattr(self.db_handler, "pending", 0),
+        )
+        if isinstance(rate_limiter, SendScheduler):
+            REGISTRY.gauge(
+                "bookshelf_send_queue_depth",
+                "Bot API calls waiting for the flood limits",
+                func=lambda: rate_limiter.queue_depth,
+            )
+            REGISTRY.gauge(
+                "bookshelf_sends_total",
+                "Outgoing calls by outcome",
+                ["result"],
+                func=lambda: dict(rate_limiter.stats),
+                kind="counter",
+            )
+        # Metadata clients wrap one another, catalog before cache before network
+        client = self.metadata_client
+        while client is not None:
+            if isinstance(client, (IsbnCatalog, IsbnCache)):
+                name = "catalog" if isinstance(client, IsbnCatalog) else "cache"
+                REGISTRY.gauge(
+                    f"bookshelf_isbn_{name}_total",
+                    f"ISBN {name} lookups by outcome",
+                    ["result"],
+                    func=lambda stats=client.stats: dict(stats),
+                    kind="counter",
+                )
+            client = getattr(client, "client", None)
+        REGISTRY.gauge(
+            "bookshelf_enrichment_total",
+            "Background metadata lookups by outcome",
+            ["result"],
+            func=lambda: dict(self.enricher.stats),
+            kind="counter",
+        )
+        REGISTRY.gauge(
+            "bookshelf_cover_cache_total",
+            "Provider cover lookups by outcome",
+            ["result"],
+            func=lambda: dict(self.covers.stats),
+            kind="counter",
+        )
+        REGISTRY.gauge(
+            "bookshelf_cover_cache_bytes",
+            "Size of the provider covers kept in memory",
+            func=lambda: self.covers.cached_bytes,
+        )
+        REGISTRY.gauge(
+            "bookshelf_persistence_total",
+            "Conversation state saves by outcome",
+            ["result"],
+            func=lambda: dict(persistence.stats),
+            kind="counter",
+        )
+
+    def run(
+        self,
+        webhook_url=None,
+        listen="127.0.0.1",
+        port=8443,
+        secret_token=None,
+        max_connections=40,
+    ):
+        """Poll for updates, or serve a webhook when `webhook_url` is given.
+
+        The embedded server only accepts posts that carry `secret_token` in
+        the X-Telegram-Bot-Api-Secret-Token header, updates replayed by a
+        local client included. It listens on localhost by default, behind a
+        reverse proxy that terminates TLS for `webhook_url`.
+        """
+        application = self.build_application()
+        if not webhook_url:
+            application.run_polling()
+            return
+
+        application.run_webhook(
+            listen=listen,
+            port=port,
+            url_path=urlsplit(webhook_url).path.lstrip("/"),
+            webhook_url=webhook_url,
+            secret_token=secret_token,
+            max_connections=max_connections,
+        )
 
     @restricted_method
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Starts the conversation and asks the user about their gender."""
-        boxes = self.db_handler.read_boxes()
+        boxes = await self.db_handler.read_boxes()
         logger.info([box.name_of_the_box for box in boxes])
 
         buttons = [box.name_of_the_box for box in boxes]
@@ -336,14 +386,21 @@ class BookShelfBot:
 
         return BOX
 
+    @staticmethod
+    def select_box(update, context, box):
+        state = shelving_state(update, context)
+        state["box_id"] = box.id
+        state["box_name"] = box.name_of_the_box
+        state.pop("book_id", None)
+
     @restricted_method
     async def add_box(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        """Chose self.box (or add a new one too)."""
+        """Chose the box of this session (or add a new one too)."""
         logger.info("Adding box: %s", update.message.text)
 
         chosen = f"Box {update.message.text}"
-        self.db_handler.create_box(chosen)
-        boxes = self.db_handler.read_boxes()
+        await self.db_handler.create_box(chosen)
+        boxes = await self.db_handler.read_boxes()
 
         logger.info([box.name_of_the_box for box in boxes])
 
@@ -352,7 +409,7 @@ class BookShelfBot:
         chosen_box = filtered_boxes[0]
 
         logger.info("Box: %s", chosen_box.name_of_the_box)
-        self.box = chosen_box
+        self.select_box(update, context, chosen_box)
 
         await update.message.reply_text(
             f"You selected box: {chosen_box.name_of_the_box}, now put a book to it. What is the book data? Send me title, author, year, description",
@@ -363,7 +420,7 @@ class BookShelfBot:
 
     @restricted_method
     async def box(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        """Chose self.box (or add a new one too)."""
+        """Chose the box of this session (or add a new one too)."""
         logger.info("Box option: %s", update.message.text)
 
         chosen = update.message.text
@@ -374,7 +431,7 @@ class BookShelfBot:
             )
             return ADD_BOX
 
-        boxes = self.db_handler.read_boxes()
+        boxes = await self.db_handler.read_boxes()
 
         logger.info([box.name_of_the_box for box in boxes])
         filtered_boxes = list(filter(lambda box: box.name_of_the_box == chosen, boxes))
@@ -382,7 +439,7 @@ class BookShelfBot:
         chosen_box = filtered_boxes[0]
 
         logger.info("Box: %s", chosen_box.name_of_the_box)
-        self.box = chosen_box
+        self.select_box(update, context, chosen_box)
 
         await update.message.reply_text(
             f"You selected box: {chosen_box.name_of_the_box}, now put a book to it. What is the book data? Send me barcode photo or title, author, year, description",
@@ -400,16 +457,8 @@ class BookShelfBot:
         delimiters = [",", ";", "|", "\n"]  # Add more delimiters as needed
         for delimiter in delimiters:
             if delimiter in update.message.text:
+                # Stored as typed, search keys cover the Latin spelling
                 title, author, year, description = update.message.text.split(delimiter)
-
-                # Transliterate if text is in Russian
-                if any(
-                    cyrillic_char in title + author + year + description
-                    for cyrillic_char in "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
-                ):
-                    title = transliterate_russian_to_english(title)
-                    author = transliterate_russian_to_english(author)
-                    description = transliterate_russian_to_english(description)
                 break
         else:
             # Handle case when none of the delimiters are found
@@ -418,14 +467,16 @@ class BookShelfBot:
             )
             return DESCRIPTION
 
-        self.book = self.db_handler.create_book(
+        state = shelving_state(update, context)
+        book = await self.db_handler.create_book(
             title=title,  # unsafe
             isbn=uuid.uuid4().hex,
             author=author,
             year=year,
             description=description,
-            box=self.box,
+            box_id=state.get("box_id"),
         )
+        state["book_id"] = book.id
 
         await update.message.reply_text(
             "Ok! Please send me a photo of cover, "
@@ -448,56 +499,151 @@ class BookShelfBot:
             )
         ):
             return
-        file = await downloader(update, context)
+        if update.message.media_group_id:
+            self.collect_album(update, context)
+            return DESCRIPTION
+        photo = await downloader(update, context)
 
-        if not file:
+        if not photo:
             await update.message.reply_text("Something went wrong, try again")
             return
 
         try:
-            isbn, img = barcode(file.as_posix())
-        except TypeError:
+            decoded = await self.decoder.decode(
+                self.decoder_key(update), photo, func=barcodes
+            )
+        except DecoderBusy:
             await update.message.reply_text(
-                f"Oops no barcode found info! Send me a title, author, year, description"
+                "I'm busy reading other barcodes, send me this photo again in a moment"
             )
             return DESCRIPTION
+        except asyncio.CancelledError:
+            # /cancel from this chat
+            return
 
-        raw = isbn_db(isbn.decode("utf-8"))
-        logger.info(raw)
-
-        # await update.message.reply_text(raw)
-        # TODO to func process
-        if raw["totalItems"] != 1:
+        if not decoded:
             await update.message.reply_text(
-                f"Oops no barcode {isbn} info! Send me a title, author, year, description"
+                f"Oops no barcode found info! Send me a title, author, year, description"
             )
-            await update.message.reply_photo(img)
             return DESCRIPTION
 
-        item = raw["items"][0]["volumeInfo"]  # unsafe
-        self.book = self.db_handler.create_book(
-            title=item["title"],  # unsafe
-            isbn=isbn,  # TODO check the same
-            author=",".join(item.get("authors", list())),
-            year=item["publishedDate"],
-            description=item.get("description", ""),
-            box=self.box,
+        if len(decoded) > 1:
+            # Several books in one shot, all go in without asking for covers
+            await self.shelve_codes(update, context, [code for code, _ in decoded])
+            return DESCRIPTION
+
+        code, _ = decoded[0]
+        isbn = normalize_isbn(code)
+
+        # Shelved at once, the lookup runs in the background and edits the reply
+        state = shelving_state(update, context)
+        book, added = await self.db_handler.shelve_isbn(
+            isbn, state.get("box_id"), update.effective_chat.id, hold=ACK_WAIT
         )
+        state["book_id"] = book.id
+        if not added:
+            if not book.cover_hash:
+                # Ready by the time the user decides to /skip
+                context.application.create_task(
+                    self.prefetch_cover(isbn), update=update
+                )
+            await update.message.reply_text(
+                f"Ok! i know this book, {book.__str__()}, now send me a cover"
+            )
+            return COVER
 
-        # logger.info("Book recognised as: %s", self.book)
-        await update.message.reply_text(
-            f"Ok! i know this book, {self.book.__str__()}, now send me a cover"
+        message = await update.message.reply_text(
+            f"Ok! Shelved {isbn} in {state.get('box_name', 'no box')}, "
+            "I'm looking it up. Now send me a cover"
         )
+        await self.db_handler.set_enrichment_message(book.id, message.message_id)
+        context.job_queue.run_once(self.enrich, 0)
 
         return COVER
 
+    async def enrich(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """JobQueue callback, fills in the books shelved by barcode."""
+        await self.enricher.run(context.bot)
+
+    def collect_album(self, update, context):
+        """Gather the photos of a media group and shelve them together."""
+        key = (*self.decoder_key(update), update.message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = {"photos": []}
+            context.application.create_task(
+                self.shelve_album(key, update, context), update=update
+            )
+        album["photos"].append(update.message.photo[-1])
+        album["last"] = time.monotonic()
+
+    async def shelve_album(self, key, update, context):
+        album = self._albums[key]
+        while (wait := album["last"] + ALBUM_WAIT - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        del self._albums[key]
+
+        photos = await asyncio.gather(*map(download, album["photos"]))
+        try:
+            found = await self.decoder.decode_many(
+                self.decoder_key(update), photos, func=barcodes
+            )
+        except DecoderBusy:
+            await update.message.reply_text(
+                "I'm busy reading other barcodes, send me these photos again in a moment"
+            )
+            return
+        except asyncio.CancelledError:
+            # /cancel from this chat
+            return
+
+        codes = [code for decoded in found for code, _ in decoded]
+        unreadable = sum(not decoded for decoded in found)
+        await self.shelve_codes(update, context, codes, unreadable)
+
+    async def shelve_codes(self, update, context, codes, unreadable=0):
+        """Shelve scanned codes together, reply once, look them up in the background."""
+        isbns = list(dict.fromkeys(normalize_isbn(code) for code in codes))
+        state = shelving_state(update, context)
+        # Without a message to edit, the enricher sends one per book when done
+        shelved = await self.db_handler.shelve_isbns(
+            isbns, state.get("box_id"), update.effective_chat.id
+        )
+        added = [book for book, is_new in shelved if is_new]
+
+        lines = [
+            f"Shelved {len(added)} of {len(isbns)} books in "
+            f"{state.get('box_name', 'no box')}"
+        ]
+        if added:
+            lines.append(
+                f"Looking up {', '.join(book.isbn for book in added)}, "
+                "I'll tell you what they are"
+            )
+        duplicates = [book.title for book, is_new in shelved if not is_new]
+        if duplicates:
+            lines.append(f"Already shelved: {', '.join(duplicates)}")
+        if unreadable:
+            lines.append(f"No barcode found on {unreadable} photo(s)")
+        await update.message.reply_text("\n".join(lines)[:MESSAGE_LIMIT])
+        if added:
+            context.job_queue.run_once(self.enrich, 0)
+
     @restricted_method
     async def cover(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Stores the photo and asks for a location."""
-        file = await downloader(update, context)
+        if update.message.media_group_id:
+            # An album is the barcodes of the next books, not this book's cover
+            self.collect_album(update, context)
+            return DESCRIPTION
+        photo = await downloader(update, context)
 
-        logger.info("Photo of cover: %s", file.as_posix())
-        self.db_handler.add_image_to_book(self.book, file.read_bytes())
+        logger.info("Photo of cover: %s bytes", len(photo))
+        # The user's own photo already has a file_id, later searches reuse it
+        file_id = update.message.photo[-1].file_id if update.message.photo else None
+        await self.db_handler.add_image_to_book(
+            shelving_state(update, context).get("book_id"), photo, file_id
+        )
 
         await update.message.reply_text("Ok, done, now you can add another book")
         await update.message.reply_text(
@@ -510,13 +656,49 @@ class BookShelfBot:
     async def skip_cover(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> int:
-        await update.message.reply_text("Ok, now you can add another book")
+        reply = await self.provider_cover(
+            shelving_state(update, context).get("book_id")
+        )
+        await update.message.reply_text(f"Ok, {reply}now you can add another book")
         await update.message.reply_text(
             "Please send me a photo of cover, so I know what it look like. Or send me a title, author, year, description."
         )
 
         return DESCRIPTION
 
+    async def provider_cover(self, book_id):
+        """Give a skipped book its provider's cover, say what became of it."""
+        status = book_id and await self.db_handler.cover_status(book_id)
+        if not status:
+            return ""
+        isbn, cover_hash, pending = status
+        if cover_hash:
+            return "it has the cover I found, "
+        if pending:
+            return "I'll add its cover if I find one, "
+        if not isbnlib.is_isbn13(isbn):
+            return ""  # Typed in, nobody to ask
+
+        try:
+            url = cover_url(await self.metadata_client.lookup(isbn))
+        except httpx.HTTPError:
+            return ""
+        # Usually prefetched while the user was deciding
+        image = url and await self.covers.fetch(url)
+        if not image:
+            return ""
+        await self.db_handler.add_image_to_book(book_id, image)
+        return "I used the cover I found, "
+
+    async def prefetch_cover(self, isbn):
+        try:
+            url = cover_url(await self.metadata_client.lookup(isbn))
+        except httpx.HTTPError:
+            return
+        if url:
+            self.covers.prefetch(url)
+
+    @bulk_output
     @restricted_method
     async def find_book(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -530,41 +712,129 @@ class BookShelfBot:
             await update.message.reply_text("Please provide a keyword to search for")
             return
 
-        for arg in args:
-            if any(
-                cyrillic_char in arg
-                for cyrillic_char in "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
-            ):
-                args.append(transliterate_russian_to_english(arg))
+        # Transliteration happens in the search keys, both scripts match already
+        keywords = list(args)
 
-        for arg in args:
-            books = self.db_handler.search_books_by_keyword(arg)
-            if not books:
-                await update.message.reply_text(
-                    f"Opps! I did not find anything by {arg}"
+        # Only the cursors of visited pages are kept, never the whole result set
+        context.user_data["search"] = {
+            "id": uuid.uuid4().hex[:8],
+            "keywords": keywords,
+            "cursors": [None],
+        }
+        await self.send_page(update.message, context.user_data["search"], 0)
+
+    @bulk_output
+    @restricted_method
+    async def find_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show another page of the last search from its inline keyboard."""
+        query = update.callback_query
+        await query.answer()
+
+        _, search_id, page = query.data.split(":")
+        search = context.user_data.get("search")
+        if not search or search["id"] != search_id:
+            await query.edit_message_text("This search has expired, run /find again")
+            return
+
+        await self.send_page(query.message, search, int(page), edit=True)
+
+    async def send_page(self, message, search, page, edit=False) -> None:
+        """Send one page of results as a single list message plus its covers."""
+        books, cursor = await self.db_handler.search_books_page(
+            search["keywords"], after=search["cursors"][page], limit=PAGE_SIZE
+        )
+        if not books:
+            await message.reply_text(
+                f"Opps! I did not find anything by {' '.join(search['keywords'])}"
+            )
+            return
+        if cursor and len(search["cursors"]) == page + 1:
+            search["cursors"].append(cursor)
+
+        lines = [
+            f"{page * PAGE_SIZE + number}. {book}"
+            for number, book in enumerate(books, start=1)
+        ]
+        buttons = []
+        if page > 0:
+            buttons.append(
+                InlineKeyboardButton(
+                    "« Prev", callback_data=f"find:{search['id']}:{page - 1}"
+                )
+            )
+        if cursor:
+            buttons.append(
+                InlineKeyboardButton(
+                    "Next »", callback_data=f"find:{search['id']}:{page + 1}"
                 )
+            )
+        reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
 
-            for book in books:
-                await update.message.reply_text(f"{book}")
-                # Send cover image as photo
-                if book.cover:
-                    cover_image = BytesIO(book.cover)
-                    cover_image.name = (
-                        "cover.jpg"  # You can change the filename if needed
-                    )
-                    await update.message.reply_photo(cover_image)
-                else:
-                    await update.message.reply_text(
-                        f"Opps! No cover image for this book"
-                    )
+        text = f"Page {page + 1}:\n" + "\n".join(lines)
+        if edit:
+            await message.edit_text(text, reply_markup=reply_markup)
+        else:
+            await message.reply_text(text, reply_markup=reply_markup)
+
+        await self.send_covers(message, [book for book in books if book.cover])
+
+    async def send_covers(self, message, books) -> None:
+        """Send the covers of a page as one media group, reusing file_ids."""
+        if len(books) == 1:
+            await self.send_cover(message, books[0].cover, caption=books[0].title)
+            return
+        if not books:
+            return
 
+        try:
+            sent = await message.reply_media_group(
+                [await self.cover_media(book, upload=False) for book in books]
+            )
+        except BadRequest:
+            logger.warning("Stale file_id in media group, uploading covers again")
+            sent = await message.reply_media_group(
+                [await self.cover_media(book, upload=True) for book in books]
+            )
+
+        for book, photo_message in zip(books, sent):
+            file_id = photo_message.photo[-1].file_id
+            if book.cover.telegram_file_id != file_id:
+                await self.db_handler.set_cover_file_id(book.cover.sha256, file_id)
+
+    async def cover_media(self, book, upload):
+        if book.cover.telegram_file_id and not upload:
+            return InputMediaPhoto(book.cover.telegram_file_id, caption=book.title)
+        return InputMediaPhoto(
+            await self.db_handler.read_cover(book.cover.sha256),
+            caption=book.title,
+            filename="cover.jpg",
+        )
+
+    async def send_cover(self, message, cover, caption=None) -> None:
+        """Send a cover by its Telegram file_id, uploading the bytes only once."""
+        if cover.telegram_file_id:
+            try:
+                await message.reply_photo(cover.telegram_file_id, caption=caption)
+                return
+            except BadRequest:
+                logger.warning("Stale file_id for cover %s, uploading again", cover)
+
+        cover_image = BytesIO(await self.db_handler.read_cover(cover.sha256))
+        cover_image.name = "cover.jpg"  # You can change the filename if needed
+        sent = await message.reply_photo(cover_image, caption=caption)
+        await self.db_handler.set_cover_file_id(cover.sha256, sent.photo[-1].file_id)
+
+    @bulk_output
     @restricted_method
     async def books_by_box(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> int:
-        box_name = self.box.__str__()  # TODO by box itself
+        box_name = shelving_state(update, context).get("box_name")
+        if box_name is None:
+            await update.message.reply_text("Select a box with /start first")
+            return DESCRIPTION
 
-        books = self.db_handler.books_in_box(box_name)
+        books = await self.db_handler.books_in_box(box_name)
         if books:
             book_list = "\n".join([f"{book.title} - {book.author}" for book in books])
             await update.message.reply_text(f"Books in {box_name}:\n{book_list}")
@@ -572,11 +842,81 @@ class BookShelfBot:
             await update.message.reply_text(f"No books found in {box_name}")
         return DESCRIPTION
 
+    @staticmethod
+    def decoder_key(update):
+        return update.effective_chat.id, update.effective_user.id
+
+    @restricted_method
+    async def import_isbns(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Import a text or CSV file of ISBNs, sent with /import or replied to."""
+        message = update.message
+        document = message.document or (
+            message.reply_to_message and message.reply_to_message.document
+        )
+        if not document:
+            await message.reply_text(
+                "Send me a text or CSV file with an ISBN and optionally a box name "
+                "on each line, with /import as its caption"
+            )
+            return
+
+        new_file = await document.get_file()
+        data = await new_file.download_as_bytearray()
+        status = await message.reply_text(f"Importing {document.file_name}...")
+        # Runs in the background so the user's other updates are not held up
+        context.application.create_task(self.run_import(status, data), update=update)
+
+    @bulk_output
+    async def run_import(self, status, data):
+        # Leaves lookup slots to the shelving sessions running meanwhile
+        importer = Importer(self.db_handler, self.metadata_client, concurrency=2)
+
+        async def progress(stats):
+            await status.edit_text(
+                f"Importing... {stats['processed']} looked up, {stats['added']} added"
+            )
+
+        result = await importer.run(data, progress=progress)
+        text = summary(result)
+        await status.edit_text(text[:MESSAGE_LIMIT])
+
+    @bulk_output
+    @restricted_method
+    async def export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Send the library, or one box, as a CSV, JSON Lines or ZIP document."""
+        args = list(context.args or [])
+        fmt = args.pop(0).lower() if args and args[0].lower() in FORMATS else "csv"
+        box_name = " ".join(args) or None
+        if box_name and not box_name.startswith("Box"):
+            box_name = f"Box {box_name}"
+
+        # Spooled to disk, the export is streamed and never held in memory
+        with tempfile.TemporaryFile() as out:
+            count = await self.db_handler.export(out, fmt, box_name)
+            if not count:
+                await update.message.reply_text(
+                    f"No books in {box_name}" if box_name else "No books yet"
+                )
+                return
+            if out.tell() > UPLOAD_LIMIT:
+                await update.message.reply_text(
+                    f"The export is {out.tell() // 2**20} MB, more than Telegram "
+                    "accepts. Export a single box or use python -m books.export"
+                )
+                return
+
+            out.seek(0)
+            name = (box_name or "library").replace(" ", "_")
+            await update.message.reply_document(
+                out, filename=f"{name}.{fmt}", caption=f"{count} books"
+            )
+
     @restricted_method
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Cancels and ends the conversation."""
         user = update.message.from_user
         logger.info("User %s canceled the conversation.", user.first_name)
+        self.decoder.cancel(self.decoder_key(update))
         await update.message.reply_text(
             "Bye! I hope we can talk again some day.",
             reply_markup=ReplyKeyboardRemove(),
@@ -599,5 +939,29 @@ if __name__ == "__main__":
         print("Token not found in the environment variable.")
         sys.exit(1)
 
-    bot = BookShelfBot(token, DatabaseHandler("sqlite:///data/books.db"))
-    bot.run()
+    db_handler = AsyncDatabaseHandler(DatabaseHandler("sqlite:///data/books.db"))
+    # Scans resolve from the local catalog (python -m books.catalog) when it has
+    # them, then from Google Books hedged with Open Library
+    metadata_client = default_client(db_handler.Session)
+    decoder = BarcodeDecoder(
+        max_workers=int(os.environ.get("BARCODE_WORKERS", 2)),
+        max_queue=int(os.environ.get("BARCODE_QUEUE", 8)),
+    )
+    # Webhook mode when WEBHOOK_URL is set, long polling otherwise
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    secret_token = os.environ.get("WEBHOOK_SECRET")
+    if webhook_url and not secret_token:
+        print("WEBHOOK_SECRET must be set together with WEBHOOK_URL.")
+        sys.exit(1)
+
+    # Prometheus metrics on localhost, METRICS_PORT=0 turns them off
+    metrics_port = int(os.environ.get("METRICS_PORT", 9464))
+
+    bot = BookShelfBot(token, db_handler, metadata_client, decoder, metrics_port)
+    bot.run(
+        webhook_url=webhook_url,
+        listen=os.environ.get("WEBHOOK_LISTEN", "127.0.0.1"),
+        port=int(os.environ.get("WEBHOOK_PORT", 8443)),
+        secret_token=secret_token,
+        max_connections=int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40)),
+    )
@@ -0,0 +1,88 @@
+"""Recognition rate and decode time of every barcode pass.
+
+The "multi" rows read photos with several books in view, the rate there is
+the share of all barcodes found.
+
+    python -m benchmarks.bench_barcode --count 200 --shelves 20
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.ean13 import corpus, shelves
+from benchmarks.stats import percentile
+from books.barcode import PASSES, recognize, recognize_all
+
+
+def timing_row(name, photos, found, total, timings):
+    return {
+        "pass": name,
+        "photos": photos,
+        "recognition_rate": found / total if total else 0.0,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000 if timings else 0.0,
+    }
+
+
+def run_multi(count, books, seed):
+    photos = list(shelves(count, books, seed))
+    results = []
+    for name, func in (("multi/one", recognize), ("multi/all", recognize_all)):
+        timings, found = [], 0
+        for codes, photo in photos:
+            started = time.perf_counter()
+            recognized = func(photo)
+            timings.append(time.perf_counter() - started)
+            if func is recognize:
+                recognized = [recognized[0]] if recognized else []
+            found += len({code.encode() for code in codes} & set(recognized))
+        results.append(timing_row(name, len(photos), found, count * books, timings))
+    return results
+
+
+def run(count, seed):
+    photos = list(corpus(count, seed))
+    setups = [(name, [(name, func)]) for name, func in PASSES]
+    setups.append(("all", PASSES))
+
+    results = []
+    for name, passes in setups:
+        timings, found = [], 0
+        for code, photo in photos:
+            started = time.perf_counter()
+            recognized = recognize(photo, passes)
+            timings.append(time.perf_counter() - started)
+            if recognized and recognized[0].decode() == code:
+                found += 1
+        results.append(timing_row(name, len(photos), found, len(photos), timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shelves", type=int, default=10, help="multi-book photos")
+    parser.add_argument("--books", type=int, default=4, help="barcodes per photo")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = run(args.count, args.seed)
+    if args.shelves:
+        results += run_multi(args.shelves, args.books, args.seed)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'pass':<10} {'rate':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in results:
+        print(
+            f"{row['pass']:<10} {row['recognition_rate']:>6.1%} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Ingest rate, memory and lookup time of the offline ISBN catalog.
+
+A synthetic Open Library dump (authors and editions, tab separated and
+gzipped like the real one) is loaded into a fresh database, then a delta
+where a share of the editions changed is loaded over it. Lookups are timed
+for ISBNs in the catalog and for misses that fall through to the client.
+
+    python -m benchmarks.bench_catalog --editions 200000 --trace-memory
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.ean13 import check_digit
+from benchmarks.library import FIRST_NAMES, LAST_NAMES, random_text
+from benchmarks.stats import percentile
+from books.catalog import CatalogIngester, IsbnCatalog, open_dump
+from books.database import DatabaseHandler
+from books.models import Base
+
+
+def isbn13(number):
+    body = f"978{number:09d}"
+    return body + check_digit(body)
+
+
+def dump_line(kind, key, last_modified, record):
+    record.update(type={"key": kind}, key=key, last_modified={"value": last_modified})
+    return (
+        f"{kind}\t{key}\t1\t{last_modified}\t{json.dumps(record, ensure_ascii=False)}\n"
+    )
+
+
+def write_dump(path, editions, authors, seed, last_modified, share=1.0):
+    """Write authors then editions, only `share` of the editions for a delta."""
+    rng = random.Random(seed)
+    with gzip.open(path, "wt", encoding="utf-8") as dump:
+        for number in range(authors):
+            dump.write(
+                dump_line(
+                    "/type/author",
+                    f"/authors/OL{number}A",
+                    last_modified,
+                    {"name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"},
+                )
+            )
+        for number in range(editions):
+            if share < 1 and rng.random() > share:
+                continue
+            dump.write(
+                dump_line(
+                    "/type/edition",
+                    f"/books/OL{number}M",
+                    last_modified,
+                    {
+                        "title": random_text(rng, rng.randint(1, 5)).capitalize(),
+                        "authors": [{"key": f"/authors/OL{rng.randrange(authors)}A"}],
+                        "publish_date": str(rng.randint(1850, 2024)),
+                        "isbn_13": [isbn13(number)],
+                        "covers": [number + 1],
+                        "description": random_text(rng, rng.randint(0, 40)),
+                    },
+                )
+            )
+
+
+def ingest(engine, path, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with open_dump(path) as dump:
+        stats = CatalogIngester(engine).ingest(dump)
+    elapsed = time.perf_counter() - started
+    result = {
+        "lines": stats["lines"],
+        "isbns": stats["isbns"],
+        "seconds": elapsed,
+        "lines_per_second": stats["lines"] / elapsed,
+        "file_mb": os.path.getsize(path) / 2**20,
+    }
+    if trace_memory:
+        result["peak_python_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+class Offline:
+    async def lookup(self, isbn):
+        return {"totalItems": 0}
+
+    async def aclose(self):
+        pass
+
+
+async def time_lookups(catalog, isbns):
+    timings = []
+    for isbn in isbns:
+        started = time.perf_counter()
+        await catalog.lookup(isbn)
+        timings.append(time.perf_counter() - started)
+    return {
+        "lookups": len(isbns),
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+    }
+
+
+def run(editions, authors, lookups, seed, trace_memory=False):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_handler = DatabaseHandler(f"sqlite:///{os.path.join(tmp, 'books.db')}")
+        Base.metadata.create_all(db_handler.engine)
+        full, delta = os.path.join(tmp, "full.txt.gz"), os.path.join(tmp, "delta.gz")
+        write_dump(full, editions, authors, seed, "2026-09-01T00:00:00")
+        write_dump(delta, editions, authors, seed + 1, "2026-10-01T00:00:00", 0.1)
+
+        results = {"full": ingest(db_handler.engine, full, trace_memory)}
+        results["delta"] = ingest(db_handler.engine, delta, trace_memory)
+
+        catalog = IsbnCatalog(db_handler.Session, Offline())
+        hits = [isbn13(rng.randrange(editions)) for _ in range(lookups)]
+        misses = [isbn13(editions + rng.randrange(editions)) for _ in range(lookups)]
+        results["hit"] = asyncio.run(time_lookups(catalog, hits))
+        results["miss"] = asyncio.run(time_lookups(catalog, misses))
+        # Without the thread hop, what the table itself costs
+        started = time.perf_counter()
+        for isbn in hits:
+            catalog.get_local(isbn)
+        results["get_local_ms"] = (time.perf_counter() - started) / lookups * 1000
+        results["database_mb"] = (
+            os.path.getsize(os.path.join(tmp, "books.db")) / 2**20
+        )
+        results["max_rss_mb"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+        db_handler.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--editions", type=int, default=100_000)
+    parser.add_argument("--authors", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="report peak Python memory of each ingest, runs slower",
+    )
+    args = parser.parse_args()
+    result = run(
+        args.editions, args.authors, args.lookups, args.seed, args.trace_memory
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
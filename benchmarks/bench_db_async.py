@@ -0,0 +1,118 @@
+"""Event loop latency under mixed database reads and cover writes.
+
+Runs the same workload against DatabaseHandler called inline on the loop
+and through AsyncDatabaseHandler, while a probe task measures how late the
+loop wakes it up.
+
+    python -m benchmarks.bench_db_async --books 20000 --users 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.library import WORDS, build_library
+from books.database import AsyncDatabaseHandler
+
+
+async def probe(lags, stop, interval=0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def user(db, inline, seed, operations, cover_size, counts):
+    rng = random.Random(seed)
+
+    async def call(name, *args, **kwargs):
+        method = getattr(db, name)
+        if inline:
+            return method(*args, **kwargs)
+        return await method(*args, **kwargs)
+
+    for number in range(operations):
+        if rng.random() < 0.2:
+            book = await call(
+                "create_book",
+                title=rng.choice(WORDS),
+                isbn=f"bench-{inline}-{seed}-{number}",
+                author="Bench",
+                year=2024,
+                description="",
+                box_id=None,
+            )
+            await call("add_image_to_book", book.id, rng.randbytes(cover_size))
+            counts["writes"] += 1
+        else:
+            await call("search_books_page", [rng.choice(WORDS)], limit=10)
+            await call("books_in_box", f"Box {rng.randint(1, 20)}")
+            counts["reads"] += 1
+        # Yield like a real handler waiting on Telegram would
+        await asyncio.sleep(0)
+
+
+async def scenario(db_handler, inline, args):
+    db = db_handler if inline else AsyncDatabaseHandler(db_handler)
+    lags, counts, stop = [], {"reads": 0, "writes": 0}, asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[
+            user(db, inline, seed, args.operations, args.cover, counts)
+            for seed in range(args.users)
+        ]
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    if not inline:
+        db.shutdown()
+
+    lags.sort()
+    return {
+        "mode": "inline" if inline else "async",
+        "seconds": elapsed,
+        "ops_per_second": (counts["reads"] + counts["writes"]) / elapsed,
+        "loop_lag_p50_ms": lags[len(lags) // 2] * 1000,
+        "loop_lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000,
+        "loop_lag_max_ms": lags[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=50)
+    parser.add_argument("--cover", type=int, default=2_000_000, help="cover bytes")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_handler = build_library(
+            f"sqlite:///{os.path.join(tmp, 'books.db')}", args.books
+        )
+        for inline in (True, False):
+            results.append(asyncio.run(scenario(db_handler, inline, args)))
+        db_handler.engine.dispose()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for row in results:
+        print(
+            ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in row.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
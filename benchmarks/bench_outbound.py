@@ -0,0 +1,166 @@
+"""Send scheduler against a fake Bot API that enforces flood limits.
+
+Telegram's limits are compressed in time (per-chat and global rates are
+configurable) so a run takes seconds. Every chat gets a burst of bulk
+messages, like a broad /find, while conversation replies keep arriving.
+
+    python -m benchmarks.bench_outbound --chats 10 --bulk 30
+    python -m benchmarks.bench_outbound --endpoint sendPhoto
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+
+from telegram.error import RetryAfter
+
+from benchmarks.stats import percentile
+from books.outbound import BULK, REPLY, SendScheduler
+
+
+class FakeTelegram:
+    """Accepts posts at most `chat_rate` per chat and `global_rate` overall per second."""
+
+    def __init__(self, chat_rate, global_rate, latency=0.01):
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.latency = latency
+        self.sent = 0
+        self.flood_errors = 0
+        self._chats = defaultdict(deque)
+        self._global = deque()
+
+    @staticmethod
+    def _over(window, rate, now):
+        while window and now - window[0] > 1:
+            window.popleft()
+        return len(window) >= rate
+
+    async def post(self, endpoint, data):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        chat = self._chats[data["chat_id"]]
+        if self._over(chat, self.chat_rate, now) or self._over(
+            self._global, self.global_rate, now
+        ):
+            self.flood_errors += 1
+            raise RetryAfter(1)
+        chat.append(now)
+        self._global.append(now)
+        self.sent += 1
+        return {"message_id": self.sent, "text": data.get("text")}
+
+
+async def send(scheduler, telegram, endpoint, chat_id, text, priority, latencies):
+    data = {"chat_id": chat_id, "text": text}
+    started = time.monotonic()
+    try:
+        if scheduler:
+            await scheduler.process_request(
+                telegram.post, (endpoint, data), {}, endpoint, data, priority
+            )
+        else:
+            await telegram.post(endpoint, data)
+    except RetryAfter:
+        latencies["failed"].append(time.monotonic() - started)
+        return
+    latencies["reply" if priority == REPLY else "bulk"].append(
+        time.monotonic() - started
+    )
+
+
+async def scenario(args, use_scheduler):
+    telegram = FakeTelegram(args.chat_rate, args.global_rate)
+    scheduler = None
+    if use_scheduler:
+        # Stay a little under the limits, like the defaults do for real Telegram
+        scheduler = SendScheduler(
+            global_rate=args.global_rate * 0.9,
+            private_rate=args.chat_rate * 0.9,
+            burst=1,
+            global_burst=1,
+            max_retries=10,
+        )
+        await scheduler.initialize()
+
+    latencies = defaultdict(list)
+    tasks = []
+    started = time.monotonic()
+    for chat_id in range(1, args.chats + 1):
+        for number in range(args.bulk):
+            tasks.append(
+                send(
+                    scheduler,
+                    telegram,
+                    args.endpoint,
+                    chat_id,
+                    f"book {number}",
+                    BULK,
+                    latencies,
+                )
+            )
+
+    async def replies(chat_id):
+        for number in range(args.replies):
+            await asyncio.sleep(0.05)
+            await send(
+                scheduler,
+                telegram,
+                "sendMessage",
+                chat_id,
+                f"reply {number}",
+                REPLY,
+                latencies,
+            )
+
+    tasks += [replies(chat_id) for chat_id in range(1, args.chats + 1)]
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    if scheduler:
+        await scheduler.shutdown()
+
+    return {
+        "mode": "scheduler" if use_scheduler else "direct",
+        "seconds": elapsed,
+        "api_calls": telegram.sent,
+        "flood_errors": telegram.flood_errors,
+        "failed_sends": len(latencies["failed"]),
+        "coalesced": scheduler.stats["coalesced"] if scheduler else 0,
+        "reply_p50_ms": percentile(latencies["reply"], 50) * 1000,
+        "reply_p95_ms": percentile(latencies["reply"], 95) * 1000,
+        "bulk_p50_ms": percentile(latencies["bulk"], 50) * 1000,
+        "bulk_p95_ms": percentile(latencies["bulk"], 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--bulk", type=int, default=30)
+    parser.add_argument("--replies", type=int, default=5)
+    parser.add_argument("--chat-rate", type=float, default=20)
+    parser.add_argument("--global-rate", type=float, default=100)
+    parser.add_argument(
+        "--endpoint",
+        default="sendMessage",
+        help="endpoint of the bulk burst, sendPhoto is never coalesced",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [asyncio.run(scenario(args, False)), asyncio.run(scenario(args, True))]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for row in results:
+        print(
+            ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in row.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
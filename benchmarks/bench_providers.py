@@ -0,0 +1,138 @@
+"""Hedged metadata resolution against local stub providers.
+
+Each scenario starts a Google Books and an Open Library stub with their
+own latency, tail, miss and partial rates, resolves a batch of ISBNs
+through HedgedResolver and reports latency percentiles, how many books came
+back complete, and what every provider was asked and answered. Answers are
+checked against the stubs' data, the script exits 1 on a wrong merge.
+
+    python -m benchmarks.bench_providers --isbns 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_catalog import isbn13
+from benchmarks.stats import percentile
+from benchmarks.stub_metadata import StubMetadataServer, volume
+from books.metadata import MetadataClient, OpenLibraryClient, book_fields
+from books.providers import HedgedResolver, Provider
+
+
+SCENARIOS = {
+    # Google answers everything quickly, Open Library should hardly be asked
+    "fast": (dict(latency=0.02), dict(latency=0.1)),
+    # One Google request in ten takes a second, hedging cuts the tail
+    "tail": (dict(latency=0.02, tail_rate=0.1), dict(latency=0.1)),
+    # Google misses or lacks fields Open Library has
+    "partial": (dict(latency=0.02, miss_rate=0.3, partial_rate=0.3), dict(latency=0.1)),
+    # Google times out on every request, Open Library alone answers
+    "google_down": (dict(latency=10), dict(latency=0.1)),
+    # Nobody answers before the deadline, lookups must fail loudly
+    "all_down": (dict(latency=10), dict(latency=10)),
+}
+
+
+def check(isbn, raw):
+    """A wrong field in the merged answer, or None if it matches the stub data."""
+    expected = volume(isbn)
+    fields = book_fields(raw)
+    if fields is None:
+        return None
+    if fields["title"] != expected["title"]:
+        return f"{isbn}: title {fields['title']!r}"
+    if fields["author"] and fields["author"] != ",".join(expected["authors"]):
+        return f"{isbn}: author {fields['author']!r}"
+    if fields["year"] != int(expected["publishedDate"][:4]):
+        return f"{isbn}: year {fields['year']}"
+    if fields["description"] and fields["description"] != expected["description"]:
+        return f"{isbn}: description"
+    return None
+
+
+async def run_scenario(google_options, library_options, isbns, deadline, delay):
+    google = StubMetadataServer(**google_options)
+    library = StubMetadataServer(api="openlibrary", **library_options)
+    await google.start()
+    await library.start()
+    resolver = HedgedResolver(
+        [
+            Provider(MetadataClient(base_url=google.url, retries=0), deadline),
+            Provider(
+                OpenLibraryClient(base_url=library.url, retries=0), deadline, delay
+            ),
+        ]
+    )
+    timings, found, complete, failed, wrong = [], 0, 0, 0, []
+
+    async def resolve(isbn):
+        nonlocal found, complete, failed
+        started = time.perf_counter()
+        try:
+            raw = await resolver.lookup(isbn)
+        except httpx.HTTPError:
+            failed += 1
+            return
+        finally:
+            timings.append(time.perf_counter() - started)
+        fields = book_fields(raw)
+        if fields:
+            found += 1
+            complete += bool(fields["author"] and fields["description"])
+        if error := check(isbn, raw):
+            wrong.append(error)
+
+    try:
+        # A handful of scans at once, like a few users shelving together
+        for start in range(0, len(isbns), 4):
+            await asyncio.gather(*[resolve(isbn) for isbn in isbns[start : start + 4]])
+    finally:
+        await resolver.aclose()
+        await google.stop()
+        await library.stop()
+
+    return {
+        "lookups": len(isbns),
+        "found": found,
+        "with_author_and_description": complete,
+        "failed": failed,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "max_ms": max(timings) * 1000,
+        "requests": {"google": google.requests, "openlibrary": library.requests},
+        "providers": dict(sorted(resolver.stats.items())),
+        "wrong": wrong[:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--isbns", type=int, default=200)
+    parser.add_argument("--deadline", type=float, default=0.5)
+    parser.add_argument("--delay", type=float, default=0.15, help="Open Library hedge")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    isbns = [isbn13(rng.randrange(10**9)) for _ in range(args.isbns)]
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        google_options, library_options = SCENARIOS[name]
+        results[name] = asyncio.run(
+            run_scenario(
+                google_options, library_options, isbns, args.deadline, args.delay
+            )
+        )
+    print(json.dumps(results, indent=2))
+    if any(result["wrong"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare the FTS5 search path with the old ILIKE table scan.
+
+    python -m benchmarks.bench_search --books 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from benchmarks.library import build_library
+from books.models import Book
+
+
+QUERIES = [
+    ["мастер"],
+    ["Булгаков"],
+    ["war", "peace"],
+    ["преступление", "наказание", "prestuplenie"],
+    ["lighthouse"],
+]
+
+
+def search_like(db_handler, *keywords):
+    """The pre-FTS implementation: one ILIKE scan per keyword."""
+    books = []
+    with db_handler.Session() as session:
+        for keyword in keywords:
+            books += (
+                session.query(Book)
+                .options(joinedload(Book.box))
+                .filter(
+                    or_(
+                        Book.title.ilike(f"%{keyword}%"),
+                        Book.author.ilike(f"%{keyword}%"),
+                        Book.description.ilike(f"%{keyword}%"),
+                    )
+                )
+                .all()
+            )
+    return books
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(result)
+
+
+def run(books, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_handler = build_library(f"sqlite:///{os.path.join(tmp, 'books.db')}", books)
+        results = []
+        for keywords in QUERIES:
+            like_time, like_rows = timed(
+                lambda: search_like(db_handler, *keywords), repeat
+            )
+            fts_time, fts_rows = timed(
+                lambda: db_handler.search_books_by_keyword(*keywords), repeat
+            )
+            results.append(
+                {
+                    "query": " ".join(keywords),
+                    "like_ms": like_time * 1000,
+                    "like_rows": like_rows,
+                    "fts_ms": fts_time * 1000,
+                    "fts_rows": fts_rows,
+                }
+            )
+        db_handler.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = run(args.books, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{'query':<40} {'like ms':>9} {'rows':>7} {'fts ms':>9} {'rows':>7}")
+    for row in results:
+        print(
+            f"{row['query']:<40} {row['like_ms']:>9.1f} {row['like_rows']:>7} "
+            f"{row['fts_ms']:>9.1f} {row['fts_rows']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Synthetic EAN-13 barcode photos for the benchmarks."""
+import random
+
+import cv2
+import numpy as np
+
+
+L_CODES = [
+    "0001101",
+    "0011001",
+    "0010011",
+    "0111101",
+    "0100011",
+    "0110001",
+    "0101111",
+    "0111011",
+    "0110111",
+    "0001011",
+]
+G_CODES = [code.translate(str.maketrans("01", "10"))[::-1] for code in L_CODES]
+R_CODES = [code.translate(str.maketrans("01", "10")) for code in L_CODES]
+PARITY = [
+    "LLLLLL",
+    "LLGLGG",
+    "LLGGLG",
+    "LLGGGL",
+    "LGLLGG",
+    "LGGLLG",
+    "LGGGLL",
+    "LGLGLG",
+    "LGLGGL",
+    "LGGLGL",
+]
+
+
+def check_digit(digits):
+    checksum = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - checksum % 10) % 10)
+
+
+def random_isbn13(rng):
+    body = rng.choice(["9785", "9780", "9781", "9783"]) + "".join(
+        rng.choice("0123456789") for _ in range(8)
+    )
+    return body + check_digit(body)
+
+
+def modules(code):
+    """Return the EAN-13 bar pattern as a string of 0/1 modules."""
+    first, left, right = int(code[0]), code[1:7], code[7:]
+    bits = "101"
+    for parity, digit in zip(PARITY[first], left):
+        bits += (L_CODES if parity == "L" else G_CODES)[int(digit)]
+    bits += "01010"
+    for digit in right:
+        bits += R_CODES[int(digit)]
+    return bits + "101"
+
+
+def render(code, module_px=3, height=160):
+    """Draw a clean barcode label with quiet zones and the digits underneath."""
+    bits = modules(code)
+    quiet = 11 * module_px
+    width = len(bits) * module_px + 2 * quiet
+    label = np.full((height + 40, width), 255, np.uint8)
+    for i, bit in enumerate(bits):
+        if bit == "1":
+            x = quiet + i * module_px
+            label[10 : 10 + height, x : x + module_px] = 0
+    cv2.putText(
+        label,
+        code,
+        (quiet, height + 34),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        0.9,
+        0,
+        2,
+        cv2.LINE_AA,
+    )
+    return label
+
+
+def photo(code, rng, difficulty=1.0, size=(1600, 1200)):
+    """Place a barcode on a busy 'cover' and degrade it like a phone photo.
+
+    `difficulty` from 0 to 1 scales rotation, perspective, blur, noise and
+    lighting so the corpus exercises every recognition pass.
+    """
+    width, height = size
+    label = render(code, module_px=rng.choice([2, 3, 4]))
+
+    cover = np.zeros((height, width, 3), np.uint8)
+    cover[:] = [rng.randint(60, 230) for _ in range(3)]
+    for _ in range(12):
+        cv2.rectangle(
+            cover,
+            (rng.randrange(width), rng.randrange(height)),
+            (rng.randrange(width), rng.randrange(height)),
+            [rng.randint(0, 255) for _ in range(3)],
+            -1,
+        )
+    for _ in range(6):
+        cv2.putText(
+            cover,
+            "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(8)),
+            (rng.randrange(width), rng.randrange(height)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            2,
+            [rng.randint(0, 255) for _ in range(3)],
+            3,
+        )
+
+    lh, lw = label.shape
+    x = rng.randrange(0, width - lw)
+    y = rng.randrange(0, height - lh)
+    cover[y : y + lh, x : x + lw] = cv2.cvtColor(label, cv2.COLOR_GRAY2BGR)
+
+    angle = rng.uniform(-40, 40) * difficulty
+    matrix = cv2.getRotationMatrix2D((x + lw / 2, y + lh / 2), angle, 1.0)
+    img = cv2.warpAffine(cover, matrix, size, borderMode=cv2.BORDER_REPLICATE)
+
+    shift = 0.12 * difficulty
+    src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    dst = src + np.float32(
+        [
+            [rng.uniform(-shift, shift) * width, rng.uniform(-shift, shift) * height]
+            for _ in range(4)
+        ]
+    )
+    img = cv2.warpPerspective(
+        img,
+        cv2.getPerspectiveTransform(src, dst),
+        size,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+    gradient = np.linspace(1.0 - 0.5 * difficulty, 1.0, width, dtype=np.float32)
+    img = (img.astype(np.float32) * gradient[None, :, None]).clip(0, 255)
+    blur = 1 + 2 * int(rng.uniform(0, 3) * difficulty)
+    img = cv2.GaussianBlur(img, (blur, blur), 0)
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(
+        0, 12 * difficulty, img.shape
+    )
+    img = (img + noise).clip(0, 255).astype(np.uint8)
+
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 75])
+    return encoded.tobytes()
+
+
+def shelf_photo(codes, rng, size=(2400, 1200)):
+    """Several books in one shot: a label per code in a loose row, mildly tilted."""
+    width, height = size
+    img = np.full((height, width, 3), [rng.randint(120, 230)] * 3, np.uint8)
+    slot = width // len(codes)
+    for number, code in enumerate(codes):
+        label = cv2.cvtColor(render(code, module_px=3), cv2.COLOR_GRAY2BGR)
+        lh, lw = label.shape[:2]
+        x = number * slot + rng.randrange(0, max(slot - lw, 1))
+        y = rng.randrange(0, height - lh)
+        img[y : y + lh, x : x + lw] = label[:, : width - x]
+
+    angle = rng.uniform(-5, 5)
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    img = cv2.warpAffine(img, matrix, size, borderMode=cv2.BORDER_REPLICATE)
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(0, 6, img.shape)
+    img = (img + noise).clip(0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return encoded.tobytes()
+
+
+def shelves(count, books=4, seed=0):
+    """Yield (isbns, encoded photo) pairs with `books` barcodes in each photo."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        codes = [random_isbn13(rng) for _ in range(books)]
+        yield codes, shelf_photo(codes, rng)
+
+
+def corpus(count, seed=0):
+    """Yield (isbn, encoded photo) pairs with difficulty spread from 0 to 1."""
+    rng = random.Random(seed)
+    for i in range(count):
+        code = random_isbn13(rng)
+        yield code, photo(code, rng, difficulty=i / max(count - 1, 1))
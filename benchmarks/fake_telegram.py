@@ -0,0 +1,155 @@
+"""In-process stand-in for the Bot API, for driving the real Application.
+
+FakeTelegram plugs into ApplicationBuilder.request, answers the calls the
+bot makes with plausible payloads and records every message sent per chat.
+Harnesses build incoming updates with the helpers below and put them on
+application.update_queue.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Shelf", "username": "shelf_bot"}
+
+
+class FakeTelegram(BaseRequest):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.files = {}
+        self.sent = defaultdict(list)
+        self.calls = defaultdict(int)
+        self._ids = itertools.count(1)
+        self._sent_changed = asyncio.Condition()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def add_file(self, content):
+        """Register an upload and return its file_id."""
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = bytes(content)
+        return file_id
+
+    def _message(self, chat_id, **fields):
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+        self.sent[int(chat_id)].append(message)
+        return message
+
+    def _photo(self):
+        file_id = f"sent-{next(self._ids)}"
+        return [
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}
+        ]
+
+    def answer(self, endpoint, params, files=None):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("sendMessage", "editMessageText"):
+            return self._message(params["chat_id"], text=params.get("text"))
+        if endpoint == "sendPhoto":
+            return self._message(
+                params["chat_id"], photo=self._photo(), caption=params.get("caption")
+            )
+        if endpoint == "sendDocument":
+            # Uploads come as multipart parts of (file name, content, mime type)
+            name, content, _ = next(iter(files.values()))
+            file_id = self.add_file(content)
+            return self._message(
+                params["chat_id"],
+                document={
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "file_name": name,
+                },
+                caption=params.get("caption"),
+            )
+        if endpoint == "sendMediaGroup":
+            return [
+                self._message(params["chat_id"], photo=self._photo())
+                for _ in params["media"]
+            ]
+        if endpoint == "getFile":
+            file_id = params["file_id"]
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")),
+                "file_path": file_id,
+            }
+        return True
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit("/", 1)[-1]
+        if "/file/bot" in url:
+            return 200, self.files[endpoint]
+
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+        files = request_data.multipart_data if request_data else {}
+        body = {"ok": True, "result": self.answer(endpoint, params, files)}
+        async with self._sent_changed:
+            self._sent_changed.notify_all()
+        return 200, json.dumps(body).encode("utf-8")
+
+    async def wait_sent(self, chat_id, count, timeout=10):
+        """Wait until the bot has sent `count` messages to the chat."""
+        async with self._sent_changed:
+            await asyncio.wait_for(
+                self._sent_changed.wait_for(lambda: len(self.sent[chat_id]) >= count),
+                timeout,
+            )
+
+
+_update_ids = itertools.count(1)
+
+
+def message_update(
+    bot, user_id, text=None, photo=None, chat_id=None, media_group_id=None
+):
+    """Build a private message Update, `photo` is a file_id from add_file."""
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id or user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            length = len(text.split(" ")[0])
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": length}
+            ]
+    if photo is not None:
+        message["photo"] = [
+            {"file_id": photo, "file_unique_id": photo, "width": 640, "height": 480}
+        ]
+    if media_group_id is not None:
+        message["media_group_id"] = media_group_id
+    return Update.de_json({"update_id": next(_update_ids), "message": message}, bot)
@@ -0,0 +1,126 @@
+"""Synthetic book libraries with mixed Cyrillic and Latin text."""
+import hashlib
+import random
+
+import cv2
+import numpy as np
+
+from books.database import DatabaseHandler
+from books.models import Base, Book, Box, Cover
+
+
+FIRST_NAMES = (
+    "Лев Фёдор Анна Михаил Марина Иван Борис Ольга Николай Александр Евгений "
+    "Leo Fyodor Anna Mikhail George Virginia Ernest Jane Thomas Agatha Mark"
+).split()
+LAST_NAMES = (
+    "Толстой Достоевский Ахматова Булгаков Цветаева Тургенев Пастернак Гоголь "
+    "Чехов Пушкин Набоков Шолохов Orwell Woolf Hemingway Austen Christie Twain "
+    "Tolstoy Dostoevsky Bulgakov Turgenev Chekhov Gogol Nabokov Dickens"
+).split()
+WORDS = (
+    "война мир преступление наказание мастер маргарита отцы дети идиот братья "
+    "жизнь судьба сад вишнёвый тихий дон история город ночь дорога море книга "
+    "время бесы мёртвые души герой нашего времени собачье сердце белая гвардия "
+    "доктор живаго анна каренина тарас бульба капитанская дочка евгений онегин "
+    "вишня степь зима лето осень весна река лес поле дом окно письмо сон путь "
+    "war peace crime punishment master garden night sea road city history "
+    "brothers life fate time old man animal farm lighthouse pride prejudice sun "
+    "river winter summer autumn spring forest field house window letter dream "
+    "journey island kingdom shadow secret murder orient express great gatsby "
+    "mockingbird rye catcher brave new world solitude hundred years love cholera"
+).split()
+random.Random(0).shuffle(WORDS)
+# Zipf-like weights so a few words are common and most are rare
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+def random_text(rng, words):
+    return " ".join(rng.choices(WORDS, WEIGHTS, k=words))
+
+
+def random_book(rng, number, box_ids):
+    return {
+        "title": random_text(rng, rng.randint(1, 5)).capitalize(),
+        "isbn": f"978{number:010d}",
+        "author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "year": rng.randint(1850, 2024),
+        "description": random_text(rng, rng.randint(10, 60)),
+        "box_id": rng.choice(box_ids),
+    }
+
+
+def random_cover(rng, size=(400, 600)):
+    """A JPEG that looks enough like a cover: colour blocks, noise and a title."""
+    width, height = size
+    img = np.zeros((height, width, 3), np.uint8)
+    img[:] = [rng.randint(30, 230) for _ in range(3)]
+    for _ in range(rng.randint(3, 8)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        cv2.rectangle(
+            img,
+            (x, y),
+            (x + rng.randint(40, width), y + rng.randint(20, height // 2)),
+            [rng.randint(0, 255) for _ in range(3)],
+            -1,
+        )
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(0, 12, img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    # Hershey fonts have no Cyrillic, the title is only there for texture
+    for line, word in enumerate(rng.sample(WORDS[-60:], 2)):
+        cv2.putText(
+            img,
+            word.upper(),
+            (20, 80 + 50 * line),
+            cv2.FONT_HERSHEY_DUPLEX,
+            1.2,
+            (255, 255, 255),
+            2,
+        )
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def build_library(
+    database_url, books, boxes=20, seed=0, batch=10_000, covers=0, cover_share=0.5
+):
+    """Create a fresh library database and fill it with `books` random books.
+
+    `covers` distinct images are generated and `cover_share` of the books get
+    one of them, a million unique JPEGs would not fit on a laptop.
+    """
+    rng = random.Random(seed)
+    db_handler = DatabaseHandler(database_url)
+    Base.metadata.create_all(db_handler.engine)
+
+    with db_handler.engine.begin() as connection:
+        connection.execute(
+            Box.__table__.insert(),
+            [{"name_of_the_box": f"Box {i}"} for i in range(1, boxes + 1)],
+        )
+    box_ids = list(range(1, boxes + 1))
+
+    cover_hashes = []
+    if covers:
+        images = [random_cover(rng) for _ in range(covers)]
+        cover_hashes = [hashlib.sha256(image).hexdigest() for image in images]
+        with db_handler.engine.begin() as connection:
+            connection.execute(
+                Cover.__table__.insert(),
+                [
+                    {"sha256": cover_hash, "data": image}
+                    for cover_hash, image in zip(cover_hashes, images)
+                ],
+            )
+
+    for start in range(0, books, batch):
+        rows = [
+            random_book(rng, number, box_ids)
+            for number in range(start, min(start + batch, books))
+        ]
+        for row in rows:
+            has_cover = cover_hashes and rng.random() < cover_share
+            row["cover_hash"] = rng.choice(cover_hashes) if has_cover else None
+        with db_handler.engine.begin() as connection:
+            connection.execute(Book.__table__.insert(), rows)
+
+    return db_handler
@@ -0,0 +1,156 @@
+"""Many admins shelving books at the same time through the real Application.
+
+Every session opens its own box, adds books with and without covers and
+lists the box, all sessions interleaved update by update. Afterwards each
+book must sit in its own session's box with its own cover, and each chat
+must only have seen its own books.
+
+    python -m benchmarks.load_shelving --sessions 50 --books 5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import app
+from benchmarks.fake_telegram import FakeTelegram, message_update
+from books.database import AsyncDatabaseHandler, DatabaseHandler
+from books.models import Base, Book, Box
+from books.outbound import SendScheduler
+
+
+FIRST_USER = 10_000
+
+
+def session_script(telegram, bot, number, books):
+    """Updates one admin sends, paired with the cover expected for each book."""
+    user_id = FIRST_USER + number
+    updates = [
+        message_update(bot, user_id, "/start"),
+        message_update(bot, user_id, "Add new box"),
+        message_update(bot, user_id, f"load-{number}"),
+    ]
+    covers = {}
+    for book in range(books):
+        title = f"Title {number}-{book}"
+        updates.append(
+            message_update(bot, user_id, f"{title},Author {number},2000,Load test")
+        )
+        if book % 2:
+            updates.append(message_update(bot, user_id, "/skip"))
+            covers[title] = None
+        else:
+            cover = f"cover of {title}".encode("utf-8") * 64
+            updates.append(message_update(bot, user_id, photo=telegram.add_file(cover)))
+            covers[title] = hashlib.sha256(cover).hexdigest()
+    updates.append(message_update(bot, user_id, "/box"))
+    return updates, covers
+
+
+def check(db_handler, telegram, expected):
+    """Return a list of everything that ended up in the wrong session."""
+    problems = []
+    with db_handler.Session() as session:
+        for number, covers in expected.items():
+            box_name = f"Box load-{number}"
+            box = session.query(Box).filter_by(name_of_the_box=box_name).one_or_none()
+            books = session.query(Book).filter_by(box=box).all() if box else []
+            found = {book.title: book.cover_hash for book in books}
+            if found != covers:
+                problems.append(f"{box_name} holds {found}, expected {covers}")
+
+            listing = [
+                message["text"]
+                for message in telegram.sent[FIRST_USER + number]
+                if (message.get("text") or "").startswith("Books in")
+            ]
+            if len(listing) != 1 or not all(title in listing[0] for title in covers):
+                problems.append(f"{box_name} was listed as {listing}")
+            elif listing[0].count(" - ") != len(covers):
+                problems.append(f"{box_name} listing has foreign books")
+    if telegram.sent[app.DEVELOPER_CHAT_ID]:
+        problems.append(f"{len(telegram.sent[app.DEVELOPER_CHAT_ID])} handler errors")
+    return problems
+
+
+async def scenario(args, database_url):
+    db_handler = DatabaseHandler(database_url)
+    Base.metadata.create_all(db_handler.engine)
+    telegram = FakeTelegram(latency=args.latency)
+    bot = app.BookShelfBot("123:load", AsyncDatabaseHandler(db_handler))
+    application = bot.build_application(
+        request=telegram,
+        rate_limiter=SendScheduler(
+            global_rate=100_000, private_rate=10_000, burst=100, global_burst=100
+        ),
+    )
+
+    app.LIST_OF_ADMINS.extend(FIRST_USER + number for number in range(args.sessions))
+    scripts, expected = [], {}
+    for number in range(args.sessions):
+        updates, covers = session_script(telegram, application.bot, number, args.books)
+        scripts.append(updates)
+        expected[number] = covers
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        # Step by step across sessions, like admins typing at the same time
+        count = 0
+        for step in range(max(len(updates) for updates in scripts)):
+            for updates in scripts:
+                if step < len(updates):
+                    await application.update_queue.put(updates[step])
+                    count += 1
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    await application.post_shutdown(application)
+
+    problems = check(db_handler, telegram, expected)
+    db_handler.engine.dispose()
+    return {
+        "sessions": args.sessions,
+        "updates": count,
+        "seconds": elapsed,
+        "updates_per_second": count / elapsed,
+        "api_calls": sum(telegram.calls.values()),
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--books", type=int, default=5, help="books per session")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per Bot API call"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(
+            scenario(args, f"sqlite:///{os.path.join(tmp, 'books.db')}")
+        )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for problem in result["problems"]:
+            print(problem)
+        print(
+            ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result.items()
+                if key != "problems"
+            )
+        )
+    raise SystemExit(1 if result["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
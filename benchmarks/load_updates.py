@@ -0,0 +1,240 @@
+"""Throughput ceiling of the real Application under many concurrent admins.
+
+The Application and ConversationHandler are the ones BookShelfBot builds
+for run(), with the fake Bot API from fake_telegram and metadata served by
+a local stub of Google Books behind the usual IsbnCache. Each session is a
+user going round after round through /start, box selection, a typed book
+(Cyrillic or Latin) with /skip, a barcode photo, /find and /cancel, sending
+the next update as soon as the previous one has been handled.
+
+The report has sustained updates per second, p50/p99 latency from putting
+an update on the queue until its handlers finished, and how late the event
+loop woke a 10 ms timer.
+
+    python -m benchmarks.load_updates --sessions 50 --rounds 4
+    python -m benchmarks.load_updates --sessions 200 --metadata-latency 0.2 --json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import app
+from benchmarks.ean13 import photo, random_isbn13
+from benchmarks.fake_telegram import FakeTelegram, message_update
+from benchmarks.library import WORDS, random_text
+from benchmarks.stats import percentile
+from benchmarks.stub_metadata import StubMetadataServer
+from books.barcode import BarcodeDecoder
+from books.cache import IsbnCache
+from books.database import AsyncDatabaseHandler, DatabaseHandler
+from books.metadata import MetadataClient
+from books.models import Base
+from books.outbound import SendScheduler
+
+
+FIRST_USER = 20_000
+
+
+class Tracker:
+    """Feeds updates to the Application and times each one until it is handled."""
+
+    def __init__(self, application):
+        self.application = application
+        self.latencies = []
+        self._waiting = {}
+
+        process_update = application.process_update
+
+        async def timed(update):
+            try:
+                await process_update(update)
+            finally:
+                started, done = self._waiting.pop(update.update_id)
+                self.latencies.append(time.perf_counter() - started)
+                done.set_result(None)
+
+        # The update loop looks the method up on the instance every time
+        application.process_update = timed
+
+    async def send(self, update):
+        done = asyncio.get_running_loop().create_future()
+        self._waiting[update.update_id] = (time.perf_counter(), done)
+        await self.application.update_queue.put(update)
+        await done
+
+
+async def watch_loop_lag(lags, interval=0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+def last_text(telegram, chat_id):
+    sent = telegram.sent[chat_id]
+    return (sent[-1].get("text") or "") if sent else ""
+
+
+async def run_session(tracker, telegram, number, photos, rng):
+    bot = tracker.application.bot
+    user_id = FIRST_USER + number
+    stats = {"recognized": 0, "busy": 0}
+
+    async def send(text=None, photo=None):
+        await tracker.send(message_update(bot, user_id, text, photo))
+
+    for round_number, photo_id in enumerate(photos):
+        await send("/start")
+        if round_number == 0:
+            await send("Add new box")
+            await send(f"e2e-{number}")
+        else:
+            await send(f"Box e2e-{number}")
+
+        title = random_text(rng, rng.randint(1, 4))
+        await send(f"{title},Author {number},{rng.randint(1900, 2024)},{title}")
+        await send("/skip")
+
+        await send(photo=photo_id)
+        reply = last_text(telegram, user_id)
+        if reply.startswith(("Ok! i know this book", "Ok! Shelved")):
+            stats["recognized"] += 1
+            await send("/skip")
+        elif reply.startswith("I'm busy"):
+            stats["busy"] += 1
+
+        await send(f"/find {rng.choice(WORDS)}")
+        await send("/cancel")
+    return stats
+
+
+async def scenario(args, database_url):
+    rng = random.Random(args.seed)
+    db_handler = DatabaseHandler(database_url)
+    Base.metadata.create_all(db_handler.engine)
+    async_db = AsyncDatabaseHandler(db_handler)
+
+    stub = StubMetadataServer(latency=args.metadata_latency, miss_rate=args.miss_rate)
+    await stub.start()
+    telegram = FakeTelegram(latency=args.latency)
+    bot = app.BookShelfBot(
+        "123:e2e",
+        async_db,
+        IsbnCache(async_db.Session, MetadataClient(base_url=stub.url)),
+        BarcodeDecoder(max_workers=args.workers, max_queue=args.decoder_queue),
+    )
+    application = bot.build_application(
+        request=telegram,
+        rate_limiter=SendScheduler(
+            global_rate=100_000, private_rate=10_000, burst=100, global_burst=100
+        ),
+    )
+    tracker = Tracker(application)
+
+    # Rendering photos is the harness's work, not the bot's, so do it up front
+    app.LIST_OF_ADMINS.extend(FIRST_USER + number for number in range(args.sessions))
+    photos = [
+        [
+            telegram.add_file(
+                photo(random_isbn13(rng), rng, difficulty=0.2, size=(800, 600))
+            )
+            for _ in range(args.rounds)
+        ]
+        for _ in range(args.sessions)
+    ]
+
+    lags = []
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        watcher = asyncio.create_task(watch_loop_lag(lags))
+        started = time.perf_counter()
+        stats = await asyncio.gather(
+            *[
+                run_session(
+                    tracker, telegram, number, photos[number], random.Random(number)
+                )
+                for number in range(args.sessions)
+            ]
+        )
+        elapsed = time.perf_counter() - started
+        watcher.cancel()
+        await application.stop()
+    await application.post_shutdown(application)
+    await stub.stop()
+    db_handler.engine.dispose()
+
+    errors = len(telegram.sent[app.DEVELOPER_CHAT_ID])
+    count = len(tracker.latencies)
+    return {
+        "sessions": args.sessions,
+        "updates": count,
+        "seconds": elapsed,
+        "updates_per_second": count / elapsed,
+        "latency_p50_ms": percentile(tracker.latencies, 50) * 1000,
+        "latency_p99_ms": percentile(tracker.latencies, 99) * 1000,
+        "latency_max_ms": max(tracker.latencies, default=0) * 1000,
+        "loop_lag_p50_ms": percentile(lags, 50) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": max(lags, default=0) * 1000,
+        "barcodes_recognized": sum(session["recognized"] for session in stats),
+        "decoder_busy": sum(session["busy"] for session in stats),
+        "metadata_requests": stub.requests,
+        "api_calls": sum(telegram.calls.values()),
+        "problems": [f"{errors} handler errors"] if errors else [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=50, help="concurrent users")
+    parser.add_argument("--rounds", type=int, default=3, help="books per session")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per Bot API call"
+    )
+    parser.add_argument(
+        "--metadata-latency", type=float, default=0.05, help="seconds per lookup"
+    )
+    parser.add_argument(
+        "--miss-rate", type=float, default=0.1, help="share of unknown ISBNs"
+    )
+    parser.add_argument("--workers", type=int, default=2, help="barcode processes")
+    parser.add_argument("--decoder-queue", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--log-level", default="WARNING", help="bot logging, INFO as in production"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(
+            scenario(args, f"sqlite:///{os.path.join(tmp, 'books.db')}")
+        )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for problem in result["problems"]:
+            print(problem)
+        print(
+            ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result.items()
+                if key != "problems"
+            )
+        )
+    raise SystemExit(1 if result["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Replay Telegram updates into the webhook server and time them.
+
+By default the real Application serves its webhook in-process against the
+fake Bot API. Shelving sessions post their updates the way Telegram does,
+each one waiting for the bot's replies before the next step. The report has
+POST latency, time until the last reply and updates per second. A post with
+a wrong secret token must be refused.
+
+With --url the updates go to a bot that is already running in webhook mode
+(WEBHOOK_URL and WEBHOOK_SECRET set), for example updates recorded one JSON
+object per line with --updates. Only POST latency is measured then.
+
+    python -m benchmarks.replay_webhook --sessions 50
+    python -m benchmarks.replay_webhook --url http://127.0.0.1:8443/telegram \\
+        --secret "$WEBHOOK_SECRET" --updates updates.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import socket
+import tempfile
+import time
+
+import httpx
+
+import app
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.load_shelving import FIRST_USER, check, session_script
+from benchmarks.stats import percentile
+from books.database import AsyncDatabaseHandler, DatabaseHandler
+from books.models import Base
+from books.outbound import SendScheduler
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def expected_replies(update):
+    # A cover or /skip is answered with two messages, everything else with one
+    message = update.message
+    return 2 if message.photo or message.text == "/skip" else 1
+
+
+async def post(client, url, secret, payload):
+    started = time.perf_counter()
+    response = await client.post(
+        url,
+        content=payload,
+        headers={SECRET_HEADER: secret, "Content-Type": "application/json"},
+    )
+    return response.status_code, time.perf_counter() - started
+
+
+async def replay_session(client, url, secret, telegram, updates, latencies):
+    chat_id = updates[0].effective_chat.id
+    replies = 0
+    for update in updates:
+        started = time.perf_counter()
+        status, elapsed = await post(
+            client, url, secret, json.dumps(update.to_dict()).encode("utf-8")
+        )
+        if status != 200:
+            raise RuntimeError(f"Webhook answered {status}")
+        latencies["post"].append(elapsed)
+
+        replies += expected_replies(update)
+        await telegram.wait_sent(chat_id, replies)
+        latencies["reply"].append(time.perf_counter() - started)
+
+
+async def local_scenario(args, database_url):
+    db_handler = DatabaseHandler(database_url)
+    Base.metadata.create_all(db_handler.engine)
+    telegram = FakeTelegram(latency=args.latency)
+    bot = app.BookShelfBot("123:replay", AsyncDatabaseHandler(db_handler))
+    application = bot.build_application(
+        request=telegram,
+        rate_limiter=SendScheduler(
+            global_rate=100_000, private_rate=10_000, burst=100, global_burst=100
+        ),
+    )
+
+    app.LIST_OF_ADMINS.extend(FIRST_USER + number for number in range(args.sessions))
+    scripts, expected = [], {}
+    for number in range(args.sessions):
+        updates, covers = session_script(telegram, application.bot, number, args.books)
+        scripts.append(updates)
+        expected[number] = covers
+
+    port, secret = free_port(), secrets.token_urlsafe(32)
+    url = f"http://127.0.0.1:{port}/telegram"
+    latencies = {"post": [], "reply": []}
+    async with application:
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path="telegram",
+            webhook_url=url,
+            secret_token=secret,
+        )
+        await application.start()
+        try:
+            async with httpx.AsyncClient() as client:
+                refused, _ = await post(client, url, "wrong", b"{}")
+                started = time.perf_counter()
+                await asyncio.gather(
+                    *[
+                        replay_session(
+                            client, url, secret, telegram, updates, latencies
+                        )
+                        for updates in scripts
+                    ]
+                )
+                elapsed = time.perf_counter() - started
+        finally:
+            await application.updater.stop()
+            await application.stop()
+    await application.post_shutdown(application)
+
+    problems = check(db_handler, telegram, expected)
+    if refused != 403:
+        problems.append(f"Post with a wrong secret answered {refused}")
+    db_handler.engine.dispose()
+    count = len(latencies["post"])
+    return {
+        "sessions": args.sessions,
+        "updates": count,
+        "seconds": elapsed,
+        "updates_per_second": count / elapsed,
+        "post_p50_ms": percentile(latencies["post"], 50) * 1000,
+        "post_p99_ms": percentile(latencies["post"], 99) * 1000,
+        "reply_p50_ms": percentile(latencies["reply"], 50) * 1000,
+        "reply_p99_ms": percentile(latencies["reply"], 99) * 1000,
+        "problems": problems,
+    }
+
+
+async def remote_scenario(args):
+    with open(args.updates, "rb") as updates:
+        payloads = [line.strip() for line in updates if line.strip()]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, problems = [], []
+
+    async def send(client, payload):
+        async with semaphore:
+            status, elapsed = await post(client, args.url, args.secret, payload)
+        if status != 200:
+            problems.append(f"Webhook answered {status}")
+        latencies.append(elapsed)
+
+    async with httpx.AsyncClient() as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[send(client, payload) for payload in payloads])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "updates": len(payloads),
+        "seconds": elapsed,
+        "updates_per_second": len(payloads) / elapsed,
+        "post_p50_ms": percentile(latencies, 50) * 1000,
+        "post_p99_ms": percentile(latencies, 99) * 1000,
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--books", type=int, default=5, help="books per session")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="seconds per Bot API call"
+    )
+    parser.add_argument("--url", help="webhook of a running bot")
+    parser.add_argument("--secret", help="its WEBHOOK_SECRET")
+    parser.add_argument("--updates", help="JSONL file of updates to post to --url")
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+    if args.url and not (args.secret and args.updates):
+        parser.error("--url needs --secret and --updates")
+
+    if args.url:
+        result = asyncio.run(remote_scenario(args))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = asyncio.run(
+                local_scenario(args, f"sqlite:///{os.path.join(tmp, 'books.db')}")
+            )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for problem in result["problems"]:
+            print(problem)
+        print(
+            ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result.items()
+                if key != "problems"
+            )
+        )
+    raise SystemExit(1 if result["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
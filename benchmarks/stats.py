@@ -0,0 +1,7 @@
+"""Summary statistics shared by the benchmarks."""
+
+
+def percentile(values, pct):
+    """Nearest-rank `pct` percentile of `values`, 0 when there are none."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0
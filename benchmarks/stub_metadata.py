@@ -0,0 +1,163 @@
+"""Local stand-ins for the Google Books and Open Library APIs.
+
+Answers GET ...?q=isbn:<isbn> (or ?bibkeys=ISBN:<isbn> for Open Library)
+with one made-up volume, with no match for a deterministic share of ISBNs,
+or with a partial record missing authors and description, after an
+optional delay. The cover links of the volumes are served as well. Connections are kept alive like the real APIs', so the
+clients' pools behave the same.
+
+    server = StubMetadataServer(latency=0.05)
+    await server.start()
+    client = MetadataClient(base_url=server.url)
+"""
+import asyncio
+import hashlib
+import json
+import random
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.library import FIRST_NAMES, LAST_NAMES, random_cover, random_text
+
+
+def volume(isbn, covers="http://books.example/covers"):
+    """The same plausible volumeInfo every time for a given ISBN."""
+    rng = random.Random(isbn)
+    return {
+        "title": random_text(rng, rng.randint(1, 5)).capitalize(),
+        "authors": [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"],
+        "publishedDate": f"{rng.randint(1850, 2024)}-01-01",
+        "description": random_text(rng, rng.randint(10, 60)),
+        "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn}],
+        "imageLinks": {
+            "thumbnail": f"{covers}/{isbn}.jpg",
+        },
+    }
+
+
+def open_library_record(volume):
+    """The same volume as the Open Library books API returns it."""
+    record = {
+        "title": volume["title"],
+        "authors": [{"name": name} for name in volume.get("authors", [])],
+        "publish_date": volume["publishedDate"][:4],
+    }
+    if "description" in volume:
+        record["notes"] = volume["description"]
+    record["cover"] = {"medium": volume["imageLinks"]["thumbnail"]}
+    return record
+
+
+class StubMetadataServer:
+    def __init__(
+        self,
+        latency=0.0,
+        miss_rate=0.0,
+        host="127.0.0.1",
+        port=0,
+        api="google",
+        partial_rate=0.0,
+        tail_rate=0.0,
+        tail_latency=1.0,
+    ):
+        self.latency = latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.miss_rate = miss_rate
+        self.api = api
+        self.partial_rate = partial_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.cover_requests = 0
+        self._server = None
+
+    @property
+    def url(self):
+        if self.api == "openlibrary":
+            return f"http://{self.host}:{self.port}/api/books"
+        return f"http://{self.host}:{self.port}/books/v1/volumes"
+
+    def _share(self, isbn, salt):
+        # Each API misses its own ISBNs, as the real ones do
+        digest = hashlib.sha256(f"{self.api}{salt}{isbn}".encode("utf-8")).digest()
+        return digest[0] / 256
+
+    def is_missing(self, isbn):
+        return self._share(isbn, "miss") < self.miss_rate
+
+    def is_partial(self, isbn):
+        return self._share(isbn, "partial") < self.partial_rate
+
+    def answer(self, isbn):
+        if self.api == "openlibrary":
+            isbn = isbn.removeprefix("ISBN:")
+        if not isbn or self.is_missing(isbn):
+            if self.api == "openlibrary":
+                return {}
+            return {"kind": "books#volumes", "totalItems": 0}
+
+        # Cover links point back here, see cover()
+        info = volume(isbn, f"http://{self.host}:{self.port}/covers")
+        if self.is_partial(isbn):
+            del info["authors"], info["description"]
+        if self.api == "openlibrary":
+            return {f"ISBN:{isbn}": open_library_record(info)}
+        return {
+            "kind": "books#volumes",
+            "totalItems": 1,
+            "items": [{"kind": "books#volume", "volumeInfo": info}],
+        }
+
+    def cover(self, isbn):
+        """A small JPEG standing in for the provider's thumbnail."""
+        return random_cover(random.Random(isbn), (128, 192))
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while request := await reader.readline():
+                while (await reader.readline()).strip():
+                    pass  # Headers, GET has no body
+                target = request.decode("latin-1").split()[1]
+                path = urlsplit(target).path
+                if path.startswith("/covers/"):
+                    self.cover_requests += 1
+                    body = self.cover(path.rsplit("/", 1)[-1].removesuffix(".jpg"))
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\n"
+                        b"Content-Type: image/jpeg\r\n"
+                        b"Content-Length: %d\r\n\r\n" % len(body) + body
+                    )
+                    await writer.drain()
+                    continue
+
+                self.requests += 1
+                params = parse_qs(urlsplit(target).query)
+                query = params.get("q", params.get("bibkeys", [""]))[0]
+                # A share of slow requests, the tail hedging is meant to cut
+                delay = self.latency
+                if self.tail_rate and random.random() < self.tail_rate:
+                    delay = self.tail_latency
+                if delay:
+                    await asyncio.sleep(delay)
+
+                body = json.dumps(self.answer(query.removeprefix("isbn:"))).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json; charset=UTF-8\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(body) + body
+                )
+                await writer.drain()
+        except (ConnectionError, IndexError, asyncio.CancelledError):
+            # Cancelled when the loop shuts down with a client still waiting
+            pass
+        finally:
+            writer.close()
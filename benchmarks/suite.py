@@ -0,0 +1,210 @@
+"""Time the database and barcode hot paths on synthetic libraries.
+
+For every library size a fresh SQLite database is filled with random
+Cyrillic and Latin books (some with covers), then search_books_by_keyword,
+books_in_box, read_boxes and create_book are timed against it. barcode()
+is timed once on synthetic EAN-13 photos. Results are JSON with the commit
+they were measured on; --compare prints the change against an earlier run.
+
+    python -m benchmarks.suite --sizes 1000,100000 --output bench.json
+    python -m benchmarks.suite --sizes 1000000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_search import QUERIES
+from benchmarks.ean13 import corpus
+from benchmarks.library import WORDS, build_library, random_book
+from benchmarks.stats import percentile
+from books.barcode import barcode
+
+
+def measure(op, books, calls):
+    """Run every zero-argument callable in `calls` once and summarize the timings."""
+    timings, rows = [], 0
+    for call in calls:
+        started = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - started)
+        rows += len(result) if isinstance(result, list) else 1
+    total = sum(timings)
+    return {
+        "op": op,
+        "books": books,
+        "runs": len(timings),
+        "rows": rows,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "ops_per_second": len(timings) / total if total else 0.0,
+    }
+
+
+def bench_library(books, repeat, covers, seed):
+    rng = random.Random(seed + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        db_handler = build_library(
+            f"sqlite:///{os.path.join(tmp, 'books.db')}",
+            books,
+            seed=seed,
+            covers=covers,
+        )
+        elapsed = time.perf_counter() - started
+        results = [
+            {
+                "op": "build_library",
+                "books": books,
+                "runs": 1,
+                "rows": books,
+                "p50_ms": elapsed * 1000,
+                "p95_ms": elapsed * 1000,
+                "mean_ms": elapsed * 1000,
+                "ops_per_second": books / elapsed,
+            }
+        ]
+
+        # Queries from bench_search plus random single words, rare ones included
+        searches = QUERIES + [
+            [rng.choice(WORDS)] for _ in range(max(repeat - len(QUERIES), 0))
+        ]
+        results.append(
+            measure(
+                "search_books_by_keyword",
+                books,
+                [
+                    lambda keywords=keywords: db_handler.search_books_by_keyword(
+                        *keywords
+                    )
+                    for keywords in searches
+                ],
+            )
+        )
+        results.append(
+            measure(
+                "books_in_box",
+                books,
+                [
+                    lambda box=f"Box {rng.randint(1, 20)}": db_handler.books_in_box(box)
+                    for _ in range(max(repeat // 10, 3))
+                ],
+            )
+        )
+        results.append(measure("read_boxes", books, [db_handler.read_boxes] * repeat))
+
+        box_ids = list(range(1, 21))
+        new_books = [random_book(rng, books + n, box_ids) for n in range(repeat)]
+        results.append(
+            measure(
+                "create_book",
+                books,
+                [
+                    lambda book=book: db_handler.create_book(**book)
+                    for book in new_books
+                ],
+            )
+        )
+        db_handler.engine.dispose()
+    return results
+
+
+def bench_barcode(count, seed):
+    photos = [photo for _, photo in corpus(count, seed)]
+    return measure(
+        "barcode", None, [lambda photo=photo: barcode(photo) for photo in photos]
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every p50 against `baseline`, return the regressions."""
+    before = {(row["op"], row["books"]): row for row in baseline["results"]}
+    regressions = []
+    print(f"{'op':<26} {'books':>8} {'before ms':>10} {'now ms':>10} {'change':>8}")
+    for row in results:
+        old = before.get((row["op"], row["books"]))
+        if not old or not old["p50_ms"]:
+            continue
+        change = row["p50_ms"] / old["p50_ms"] - 1
+        flag = " !" if change > threshold else ""
+        if flag:
+            regressions.append(row)
+        print(
+            f"{row['op']:<26} {row['books'] or '':>8} {old['p50_ms']:>10.2f} "
+            f"{row['p50_ms']:>10.2f} {change:>+8.0%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes", default="1000,100000", help="comma separated library sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="calls per operation")
+    parser.add_argument("--covers", type=int, default=200, help="distinct cover images")
+    parser.add_argument(
+        "--photos", type=int, default=50, help="barcode photos, 0 skips"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="p50 slowdown that fails --compare"
+    )
+    args = parser.parse_args()
+
+    results = []
+    for books in (int(size) for size in args.sizes.split(",") if size):
+        print(f"Library of {books} books...", file=sys.stderr, flush=True)
+        results += bench_library(books, args.repeat, args.covers, args.seed)
+    if args.photos:
+        print(f"{args.photos} barcode photos...", file=sys.stderr, flush=True)
+        results.append(bench_barcode(args.photos, args.seed))
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "args": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(output + "\n")
+    if not args.compare:
+        print(output)
+        return
+
+    with open(args.compare) as baseline:
+        regressions = compare(results, json.load(baseline), args.threshold)
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import ZBarSymbol, decode
+
+from books.metrics import IO_ERRORS, IO_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+# Photos are scaled down to this size before the cheap passes
+MAX_SIDE = 1024
+
+
+def ean13_valid(code):
+    """Check the EAN-13 checksum, which also covers ISBN-13 (978/979 prefixes)."""
+    if len(code) != 13 or not code.isdigit():
+        return False
+    digits = [int(c) for c in code]
+    checksum = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return (10 - checksum % 10) % 10 == digits[12]
+
+
+def _order_points(points):
+    # top-left, top-right, bottom-right, bottom-left
+    s = points.sum(axis=1)
+    d = np.diff(points, axis=1).ravel()
+    return np.float32(
+        [points[s.argmin()], points[d.argmin()], points[s.argmax()], points[d.argmax()]]
+    )
+
+
+def detect_regions(gray, limit=10):
+    """Locate barcode-like areas, dense gradients in one direction, largest first."""
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=-1))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=-1))
+    gradient = cv2.blur(cv2.absdiff(grad_x, grad_y), (9, 9))
+    _, thresh = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    closed = cv2.dilate(cv2.erode(closed, None, iterations=4), None, iterations=4)
+
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:limit]
+    if not contours:
+        return []
+    # Specks next to a real barcode are not worth a crop
+    smallest = cv2.contourArea(contours[0]) / 10
+    return [
+        cv2.minAreaRect(contour)
+        for contour in contours
+        if cv2.contourArea(contour) >= smallest
+    ]
+
+
+class Frame:
+    """One decoded photo plus the grayscale views shared by all passes."""
+
+    def __init__(self, img):
+        self.full_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        self.scale = min(1.0, MAX_SIDE / max(self.full_gray.shape))
+        if self.scale < 1:
+            self.gray = cv2.resize(
+                self.full_gray,
+                None,
+                fx=self.scale,
+                fy=self.scale,
+                interpolation=cv2.INTER_AREA,
+            )
+        else:
+            self.gray = self.full_gray
+        self._regions = None
+
+    @property
+    def regions(self):
+        if self._regions is None:
+            self._regions = detect_regions(self.gray)
+        return self._regions
+
+    @property
+    def region(self):
+        return self.regions[0] if self.regions else None
+
+
+# Every pass yields (candidate image, (scale, offset)) where the second item maps
+# a rect found on the candidate back to the photo, or None when it cannot.
+
+
+def _gray_pass(frame):
+    yield frame.gray, (frame.scale, (0, 0))
+
+
+def _threshold_pass(frame):
+    adaptive = cv2.adaptiveThreshold(
+        frame.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10
+    )
+    yield adaptive, (frame.scale, (0, 0))
+    blurred = cv2.GaussianBlur(frame.gray, (5, 5), 0)
+    _, otsu = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    yield otsu, (frame.scale, (0, 0))
+
+
+def _geometry_pass(frame):
+    h, w = frame.gray.shape
+    for angle in (15, -15, 30, -30, 45, -45):
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        yield cv2.warpAffine(frame.gray, matrix, (w, h), borderValue=255), None
+
+    # Perspective candidate: warp the detected quadrilateral to an upright rectangle
+    if frame.region is not None:
+        (_, _), (rw, rh), _ = frame.region
+        if rw >= 1 and rh >= 1:
+            src = _order_points(cv2.boxPoints(frame.region))
+            width = int(np.linalg.norm(src[1] - src[0]))
+            height = int(np.linalg.norm(src[3] - src[0]))
+            dst = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+            matrix = cv2.getPerspectiveTransform(src, dst)
+            warped = cv2.warpPerspective(frame.gray, matrix, (width, height))
+            yield cv2.copyMakeBorder(
+                warped, 20, 20, 20, 20, cv2.BORDER_CONSTANT, value=255
+            ), None
+
+
+def _crop_pass(frame):
+    if frame.region is not None:
+        yield from _crop_candidates(frame, frame.region)
+
+
+def _regions_pass(frame):
+    for region in frame.regions:
+        yield from _crop_candidates(frame, region)
+
+
+def _crop_candidates(frame, region):
+    x, y, w, h = cv2.boundingRect(np.intp(cv2.boxPoints(region)))
+    # Crop from the full resolution photo so the bars keep all their detail
+    pad_x, pad_y = w // 4, h // 4
+    x0 = max(int((x - pad_x) / frame.scale), 0)
+    y0 = max(int((y - pad_y) / frame.scale), 0)
+    x1 = int((x + w + pad_x) / frame.scale)
+    y1 = int((y + h + pad_y) / frame.scale)
+    crop = frame.full_gray[y0:y1, x0:x1]
+    if crop.size == 0:
+        return
+
+    zoom = max(1.0, 600 / crop.shape[1])
+    if zoom > 1:
+        crop = cv2.resize(crop, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_CUBIC)
+    yield crop, (zoom, (x0, y0))
+    sharpened = cv2.addWeighted(crop, 1.5, cv2.GaussianBlur(crop, (0, 0), 3), -0.5, 0)
+    yield sharpened, (zoom, (x0, y0))
+    _, binary = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    yield binary, (zoom, (x0, y0))
+
+
+# Cheapest first, recognition stops at the first pass with a valid code
+PASSES = [
+    ("gray", _gray_pass),
+    ("threshold", _threshold_pass),
+    ("geometry", _geometry_pass),
+    ("crop", _crop_pass),
+]
+
+
+def recognize(image, passes=PASSES):
+    """Run the recognition passes over an encoded photo.
+
+    Returns (data, rect, pass name) for the first barcode with a valid EAN-13
+    checksum, or None. The rect is in photo coordinates, or None when the code
+    was found on a rotated or warped candidate.
+    """
+    img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    frame = Frame(img)
+    for name, candidates in passes:
+        for candidate, mapping in candidates(frame):
+            for data, rect in _symbols(candidate, mapping):
+                return data, rect, name
+    return None
+
+
+# Collecting every code runs these passes until each region has a code, as
+# each can find codes the others missed; see recognize_all
+MULTI_PASSES = [
+    ("gray", _gray_pass),
+    ("threshold", _threshold_pass),
+    ("regions", _regions_pass),
+    ("geometry", _geometry_pass),
+]
+
+
+def _symbols(candidate, mapping):
+    for symbol in decode(candidate, symbols=[ZBarSymbol.EAN13]):
+        if not ean13_valid(symbol.data.decode("ascii", "ignore")):
+            continue
+        rect = None
+        if mapping:
+            scale, (ox, oy) = mapping
+            rect = tuple(
+                int(v / scale) + o for v, o in zip(symbol.rect, (ox, oy, 0, 0))
+            )
+        yield symbol.data, rect
+
+
+def recognize_all(image, passes=MULTI_PASSES):
+    """Find every distinct barcode in an encoded photo, e.g. several spines.
+
+    Returns {data: rect}. Recognition stops as soon as there is a code for
+    every barcode-like region, and the rotations only run when nothing was
+    found at all, so a photo of a single book costs about what recognize()
+    does.
+    """
+    img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return {}
+
+    frame = Frame(img)
+    found = {}
+    for name, candidates in passes:
+        if name == "geometry" and found:
+            continue
+        for candidate, mapping in candidates(frame):
+            for data, rect in _symbols(candidate, mapping):
+                if found.get(data) is None:
+                    found[data] = rect
+            if found and len(found) >= len(frame.regions):
+                return found
+    return found
+
+
+def barcodes(image):
+    """Find all barcodes in an encoded photo as a list of (data, rect)."""
+    found = recognize_all(image)
+    logger.info("Barcodes found: %s", list(found))
+    return list(found.items())
+
+
+def barcode(image):
+    """Find a barcode in an encoded photo, return its data and rect or None."""
+    recognized = recognize(image)
+
+    if not recognized:
+        logger.info("Barcode Not Detected or your barcode is blank/corrupted!")
+        return None
+
+    data, rect, name = recognized
+    logger.info("Barcode is: %s, found by %s pass", data, name)
+    return data, rect
+
+
+def _init_worker():
+    # A fresh process maps, and faults in, every photo sized buffer anew. glibc
+    # stops doing that for sizes up to the largest mapped buffer it has freed,
+    # which a worker forked from the bot used to inherit.
+    np.empty(16 * 2**20, np.uint8)
+
+
+def _started():
+    return None
+
+
+class DecoderBusy(Exception):
+    """Raised when the decode queue is full and the photo should be resent later."""
+
+
+class BarcodeDecoder:
+    """Runs `barcode()` in a process pool so decoding never blocks the event loop.
+
+    At most `max_workers` photos are decoded at once and at most `max_queue`
+    more wait for a worker; anything beyond that is refused with DecoderBusy.
+    Jobs are keyed (usually by chat and user) so /cancel from that user stops
+    waiting for its photos, all photos of an album form one job. A photo a
+    worker has already started keeps its slot until the worker is done.
+    """
+
+    def __init__(self, max_workers=2, max_queue=8):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        # Forked workers would inherit locks held by the bot's other threads,
+        # e.g. a logging handler's, and could hang on them for good. They fork
+        # from a server instead, which has OpenCV imported already.
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=context, initializer=_init_worker
+        )
+        self._jobs = {}
+        self._inflight = set()
+        self.latencies = deque(maxlen=256)
+
+    @property
+    def pending(self):
+        return len(self._inflight)
+
+    @property
+    def queue_depth(self):
+        return max(self.pending - self.max_workers, 0)
+
+    async def start(self):
+        """Start the workers now, so the first photos do not wait for them."""
+        await asyncio.gather(
+            *[
+                asyncio.wrap_future(self._pool.submit(_started))
+                for _ in range(self.max_workers)
+            ]
+        )
+
+    def cancel(self, key):
+        jobs = [job for job in self._jobs.pop(key, ()) if not job.done()]
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            logger.info("Cancelled barcode decoding for %s", key)
+
+    async def decode(self, key, image, func=barcode):
+        return (await self.decode_many(key, [image], func))[0]
+
+    async def decode_many(self, key, images, func=barcode):
+        """Decode several photos in parallel as one job, results in their order."""
+        if self.pending + len(images) > self.max_workers + self.max_queue:
+            raise DecoderBusy(f"{self.pending} photos are already being decoded")
+
+        work = [self._pool.submit(func, image) for image in images]
+        for future in work:
+            # The pool's future is done only when its worker is, cancelling the
+            # job does not stop a decode that already started
+            self._inflight.add(future)
+            future.add_done_callback(self._inflight.discard)
+        job = asyncio.gather(*map(asyncio.wrap_future, work))
+        jobs = self._jobs.setdefault(key, set())
+        jobs.add(job)
+        started = time.perf_counter()
+        try:
+            return await job
+        except Exception:
+            IO_ERRORS.inc("barcode_decode")
+            raise
+        finally:
+            jobs.discard(job)
+            if not jobs and self._jobs.get(key) is jobs:
+                del self._jobs[key]
+            if not job.cancelled():
+                elapsed = time.perf_counter() - started
+                self.latencies.append(elapsed)
+                IO_SECONDS.observe(elapsed, "barcode_decode")
+                logger.info(
+                    "Decoded %s photos (%s bytes) in %.0f ms, queue depth %s",
+                    len(images),
+                    sum(map(len, images)),
+                    elapsed * 1000,
+                    self.queue_depth,
+                )
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
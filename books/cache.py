@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+
+import isbnlib
+
+from books.models import IsbnLookup
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_isbn(code):
+    """Return the ISBN-13 form of a scanned code, or the bare code if it is not an ISBN."""
+    if isinstance(code, bytes):
+        code = code.decode("utf-8")
+    canonical = isbnlib.canonical(code)
+    if isbnlib.is_isbn10(canonical):
+        return isbnlib.to_isbn13(canonical)
+    return canonical or code.strip()
+
+
+class IsbnCache:
+    """Metadata lookup cache stored in the books database.
+
+    Wraps a metadata client and keeps every answer, found or not, in the
+    `isbn_lookups` table keyed on the ISBN-13. Hits and misses expire after
+    their own TTL; a small in-process LRU sits in front so repeated scans
+    do not even touch SQLite.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        client,
+        hit_ttl=30 * 24 * 3600,
+        miss_ttl=24 * 3600,
+        lru_size=1024,
+    ):
+        self.Session = session_factory
+        self.client = client
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self.stats = Counter()
+
+    @staticmethod
+    def is_found(raw):
+        return raw.get("totalItems") == 1
+
+    def _expired(self, found, fetched_at):
+        ttl = self.hit_ttl if found else self.miss_ttl
+        return time.time() - fetched_at > ttl
+
+    def _remember(self, isbn, found, raw, fetched_at):
+        self._lru[isbn] = (found, raw, fetched_at)
+        self._lru.move_to_end(isbn)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_memory(self, isbn):
+        entry = self._lru.get(isbn)
+        if entry and not self._expired(entry[0], entry[2]):
+            self._lru.move_to_end(isbn)
+            self.stats["memory_hits"] += 1
+            return entry[1]
+        return None
+
+    def get_stored(self, isbn):
+        """Read a fresh entry from the table as (found, raw, fetched_at) or None."""
+        with self.Session() as session:
+            row = session.get(IsbnLookup, isbn)
+            if row is None or self._expired(row.found, row.fetched_at):
+                return None
+            return row.found, json.loads(row.payload), row.fetched_at
+
+    def store(self, isbn, found, raw, fetched_at):
+        with self.Session() as session:
+            session.merge(
+                IsbnLookup(
+                    isbn=isbn,
+                    found=found,
+                    payload=json.dumps(raw, ensure_ascii=False),
+                    fetched_at=fetched_at,
+                )
+            )
+            session.commit()
+
+    async def get(self, isbn):
+        """Return a cached response or None when it is unknown or stale."""
+        raw = self.get_memory(isbn)
+        if raw is not None:
+            return raw
+
+        # SQLite work runs on a thread, the LRU is only touched on the loop
+        entry = await asyncio.to_thread(self.get_stored, isbn)
+        if entry is None:
+            return None
+        self._remember(isbn, *entry)
+        self.stats["db_hits"] += 1
+        return entry[1]
+
+    async def put(self, isbn, raw):
+        found = self.is_found(raw)
+        fetched_at = time.time()
+        await asyncio.to_thread(self.store, isbn, found, raw, fetched_at)
+        self._remember(isbn, found, raw, fetched_at)
+
+    async def lookup(self, isbn):
+        """Same contract as MetadataClient.lookup, served from cache when possible."""
+        isbn = normalize_isbn(isbn)
+        raw = await self.get(isbn)
+        if raw is not None:
+            self.stats["negative_hits" if not self.is_found(raw) else "hits"] += 1
+            return raw
+
+        self.stats["misses"] += 1
+        raw = await self.client.lookup(isbn)
+        await self.put(isbn, raw)
+        logger.info("Cached lookup of %s, cache stats: %s", isbn, dict(self.stats))
+        return raw
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,288 @@
+"""Offline ISBN metadata loaded from bulk bibliographic dumps.
+
+Open Library publishes its editions and authors as dumps, one record per
+line, either tab separated (type, key, revision, last_modified, JSON) or as
+plain JSON lines. Both are read as a stream, gzipped or not, and written in
+batches, so memory use does not depend on the size of the dump. A record is
+only written when it is not older than the stored one, so loading a later
+dump or a delta over an existing catalog refreshes it incrementally.
+
+    python -m books.catalog ol_dump_authors_latest.txt.gz \\
+        ol_dump_editions_latest.txt.gz --database sqlite:///data/books.db
+    python -m books.catalog editions_delta.jsonl --since 2026-10-01
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import time
+from collections import Counter
+
+import isbnlib
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert
+
+from books.cache import normalize_isbn
+from books.metadata import YEAR
+from books.metrics import observe_io
+from books.models import CatalogAuthor, CatalogEdition
+
+
+logger = logging.getLogger(__name__)
+
+EDITION, AUTHOR = "/type/edition", "/type/author"
+# Editions list cover image ids, the images themselves live here
+COVER_URL = "https://covers.openlibrary.org/b/id/{}-L.jpg"
+
+
+def open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def parse_line(line, since=None):
+    """Return (type, key, last_modified, record) of a dump line, or None.
+
+    Tab separated lines carry the type and date up front, so records older
+    than `since` are skipped without parsing their JSON. Malformed lines
+    raise ValueError, TypeError or AttributeError.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        record = json.loads(line)
+        kind = record.get("type", {}).get("key")
+        last_modified = record.get("last_modified", {}).get("value", "")
+    else:
+        fields = line.split("\t", 4)
+        if len(fields) != 5:
+            return None
+        kind, _, _, last_modified, data = fields
+        if kind not in (EDITION, AUTHOR) or (since and last_modified < since):
+            return None
+        record = json.loads(data)
+    key = record.get("key")
+    if not isinstance(key, str) or not isinstance(last_modified, str):
+        raise ValueError(f"Malformed record {line[:80]!r}")
+    if since and last_modified < since:
+        return None
+    return kind, key, last_modified, record
+
+
+def _text(value):
+    # Descriptions come as a plain string or as {"type": "/type/text", "value": ...}
+    if isinstance(value, dict):
+        value = value.get("value")
+    return value if isinstance(value, str) else None
+
+
+def edition_rows(key, last_modified, record):
+    """One catalog row per distinct ISBN-13 of an edition."""
+    isbns = set()
+    for code in record.get("isbn_13", []) + record.get("isbn_10", []):
+        isbn = normalize_isbn(code)
+        if isbnlib.is_isbn13(isbn):
+            isbns.add(isbn)
+    title = _text(record.get("title"))
+    if not isbns or not title:
+        return []
+
+    year = YEAR.search(record.get("publish_date", ""))
+    # Removed covers stay in the list as -1
+    covers = [cover for cover in record.get("covers", []) if cover and cover > 0]
+    row = {
+        "title": title,
+        "author_keys": " ".join(
+            author["key"] for author in record.get("authors", []) if "key" in author
+        )
+        or None,
+        "by_statement": _text(record.get("by_statement")),
+        "year": int(year.group(1)) if year else None,
+        "description": _text(record.get("description")),
+        "cover_id": covers[0] if covers else None,
+        "source_key": key,
+        "last_modified": last_modified,
+    }
+    return [{"isbn": isbn, **row} for isbn in sorted(isbns)]
+
+
+def _upsert(model, index, columns):
+    statement = insert(model.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=[index],
+        set_={column: statement.excluded[column] for column in columns},
+        # Older copies of a record never overwrite newer ones, loading the same
+        # dump again fills in columns added since
+        where=statement.excluded.last_modified >= model.__table__.c.last_modified,
+    )
+
+
+class CatalogIngester:
+    def __init__(self, engine, batch_size=5000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self._editions = _upsert(
+            CatalogEdition,
+            "isbn",
+            [
+                "title",
+                "author_keys",
+                "by_statement",
+                "year",
+                "description",
+                "cover_id",
+                "source_key",
+                "last_modified",
+            ],
+        )
+        self._authors = _upsert(CatalogAuthor, "key", ["name", "last_modified"])
+
+    def _write(self, editions, authors):
+        with self.engine.begin() as connection:
+            if editions:
+                connection.execute(self._editions, editions)
+            if authors:
+                connection.execute(self._authors, authors)
+
+    def ingest(self, lines, since=None, progress=None):
+        """Load dump lines, return counts of what was read and written."""
+        stats = Counter()
+        editions, authors = [], []
+        for line in lines:
+            stats["lines"] += 1
+            try:
+                parsed = parse_line(line, since)
+                if parsed is None:
+                    stats["skipped"] += 1
+                    continue
+                kind, key, last_modified, record = parsed
+                if kind == EDITION:
+                    rows = edition_rows(key, last_modified, record)
+                    editions += rows
+                    stats["isbns"] += len(rows)
+                elif kind == AUTHOR and (name := _text(record.get("name"))):
+                    authors.append(
+                        {"key": key, "name": name, "last_modified": last_modified}
+                    )
+                    stats["authors"] += 1
+                else:
+                    stats["skipped"] += 1
+            except (ValueError, TypeError, AttributeError):
+                # Not JSON, or a field of the wrong shape, e.g. "type": null
+                stats["errors"] += 1
+                continue
+
+            if len(editions) + len(authors) >= self.batch_size:
+                self._write(editions, authors)
+                editions, authors = [], []
+                if progress:
+                    progress(stats)
+        self._write(editions, authors)
+        return stats
+
+
+_EDITION = select(CatalogEdition.__table__).where(
+    CatalogEdition.isbn == bindparam("isbn")
+)
+_AUTHORS = select(CatalogAuthor.key, CatalogAuthor.name).where(
+    CatalogAuthor.key.in_(bindparam("keys", expanding=True))
+)
+
+
+class IsbnCatalog:
+    """Metadata client that answers from the local catalog first.
+
+    A hit is a primary key read in SQLite, shaped like a Google Books
+    response so callers do not care where it came from. Misses go to the
+    wrapped client, usually the IsbnCache in front of the network.
+    """
+
+    def __init__(self, session_factory, client):
+        self.Session = session_factory
+        self.client = client
+        self.stats = Counter()
+
+    def get_local(self, isbn):
+        # Plain rows instead of ORM objects, this runs on every scan
+        with self.Session() as session:
+            edition = session.execute(_EDITION, {"isbn": isbn}).first()
+            if edition is None:
+                return None
+            keys = (edition.author_keys or "").split()
+            names = (
+                dict(session.execute(_AUTHORS, {"keys": keys}).all()) if keys else {}
+            )
+
+        authors = [names[key] for key in keys if key in names]
+        if not authors and edition.by_statement:
+            authors = [edition.by_statement]
+        volume = {
+            "title": edition.title,
+            "authors": authors,
+            "publishedDate": str(edition.year or ""),
+            "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn}],
+        }
+        if edition.description:
+            volume["description"] = edition.description
+        if edition.cover_id:
+            volume["imageLinks"] = {"large": COVER_URL.format(edition.cover_id)}
+        return {
+            "kind": "books#volumes",
+            "totalItems": 1,
+            "items": [{"volumeInfo": volume}],
+            "source": edition.source_key,
+        }
+
+    async def lookup(self, isbn):
+        """Same contract as MetadataClient.lookup, the network only on a local miss."""
+        isbn = normalize_isbn(isbn)
+        with observe_io("isbn_catalog"):
+            raw = await asyncio.to_thread(self.get_local, isbn)
+        if raw is not None:
+            self.stats["hits"] += 1
+            return raw
+        self.stats["misses"] += 1
+        return await self.client.lookup(isbn)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def main():
+    from books.database import DatabaseHandler
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("dumps", nargs="+", help="dump files, .gz or plain")
+    parser.add_argument("--database", default="sqlite:///data/books.db")
+    parser.add_argument("--since", help="skip records last modified before this date")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per transaction")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    ingester = CatalogIngester(DatabaseHandler(args.database).engine, args.batch)
+    started = last_progress = time.perf_counter()
+
+    def progress(stats):
+        nonlocal last_progress
+        if time.perf_counter() - last_progress < 5:
+            return
+        last_progress = time.perf_counter()
+        print(
+            f"{stats['lines']} lines, {stats['isbns']} ISBNs, "
+            f"{stats['authors']} authors, {time.perf_counter() - started:.0f} s",
+            flush=True,
+        )
+
+    for path in args.dumps:
+        with open_dump(path) as dump:
+            stats = ingester.ingest(dump, since=args.since, progress=progress)
+        print(f"{path}: {dict(stats)}")
+
+
+if __name__ == "__main__":
+    main()
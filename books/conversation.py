@@ -0,0 +1,73 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application
+
+from books.metrics import UPDATES_IN_FLIGHT
+
+
+class KeyedApplication(Application):
+    """Application that handles updates of different users concurrently.
+
+    With concurrent_updates every update gets its own task, which would let
+    two messages of the same user race through the ConversationHandler.
+    Updates are serialized per (chat, user) key instead, so each shelving
+    session keeps its order while other sessions run next to it. Commands in
+    `interrupts` skip the line, /cancel has to reach a session that is still
+    busy decoding a barcode.
+    """
+
+    interrupts = ("/cancel", "/stop", "/exit")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # key -> [lock, number of updates holding or waiting for it]
+        self._keys = {}
+
+    @staticmethod
+    def update_key(update):
+        if not isinstance(update, Update):
+            return None
+        chat, user = update.effective_chat, update.effective_user
+        if chat is None and user is None:
+            return None
+        return (chat and chat.id, user and user.id)
+
+    def _is_interrupt(self, update):
+        message = update.effective_message if isinstance(update, Update) else None
+        text = (message and message.text) or ""
+        return text.split("@")[0].split(" ")[0] in self.interrupts
+
+    async def process_update(self, update: object) -> None:
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            await self._process_keyed(update)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+
+    async def _process_keyed(self, update):
+        key = self.update_key(update)
+        if key is None or self._is_interrupt(update):
+            await super().process_update(update)
+            return
+
+        entry = self._keys.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._keys[key]
+
+
+def shelving_state(update, context):
+    """Shelving session of the user in the current chat.
+
+    Lives in user_data under the chat id, so the same admin can shelve in a
+    group and in private at once. Only plain ids and names are kept, never
+    ORM objects.
+    """
+    sessions = context.user_data.setdefault("shelving", {})
+    return sessions.setdefault(str(update.effective_chat.id), {})
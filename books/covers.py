@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+
+import httpx
+
+from books.metrics import observe_io
+
+
+logger = logging.getLogger(__name__)
+
+
+class CoverFetcher:
+    """Downloads the cover images metadata providers link to.
+
+    Shares one keep-alive pool across downloads. Anything that is not an
+    image of a sensible size comes back as None: providers answer missing
+    covers with a 1x1 placeholder, and a book is better without a cover
+    than with that.
+
+    Images are kept in an LRU bounded by `cache_bytes`, and prefetch()
+    starts a download in the background, so by the time the user skips
+    sending a photo the provider's cover is usually already here. A fetch
+    of a URL that is still downloading waits for that download.
+    """
+
+    def __init__(
+        self,
+        timeout=5.0,
+        max_connections=4,
+        min_bytes=1024,
+        max_bytes=2 * 2**20,
+        cache_bytes=32 * 2**20,
+    ):
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.cache_bytes = cache_bytes
+        self.stats = Counter()
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._downloads = {}
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            follow_redirects=True,
+        )
+
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    def _remember(self, url, image):
+        # None is remembered too, a link without a usable image stays that way,
+        # and is charged the length of its URL so those entries stay bounded
+        self._cache[url] = image
+        self._cached_bytes += len(image or url)
+        while self._cached_bytes > self.cache_bytes:
+            evicted_url, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted or evicted_url)
+            self.stats["evicted"] += 1
+
+    def prefetch(self, url):
+        """Start downloading `url` unless it is cached or on its way."""
+        if url in self._cache:
+            return None
+        if url not in self._downloads:
+            self.stats["downloads"] += 1
+            download = asyncio.ensure_future(self._download(url))
+            download.add_done_callback(lambda _: self._downloads.pop(url, None))
+            self._downloads[url] = download
+        return self._downloads[url]
+
+    async def fetch(self, url):
+        """Image bytes behind `url`, or None if there is no usable image."""
+        if url in self._cache:
+            self.stats["hits"] += 1
+            self._cache.move_to_end(url)
+            return self._cache[url]
+        # A prefetch still on its way is waited for rather than repeated
+        self.stats["waits" if url in self._downloads else "misses"] += 1
+        # Shielded, a cancelled caller does not abort the shared download
+        return await asyncio.shield(self.prefetch(url))
+
+    async def _download(self, url):
+        try:
+            with observe_io("cover_fetch"):
+                response = await self._client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            logger.warning("Cover %s not fetched: %s", url, exc)
+            if exc.response.status_code == 404:
+                self._remember(url, None)
+            return None
+        except httpx.HTTPError as exc:
+            # Not remembered, the next fetch tries again
+            logger.warning("Cover %s not fetched: %s", url, exc)
+            return None
+
+        image = response.content
+        content_type = response.headers.get("Content-Type", "")
+        if not content_type.startswith("image/") or not (
+            self.min_bytes <= len(image) <= self.max_bytes
+        ):
+            image = None
+        self._remember(url, image)
+        return image
+
+    async def aclose(self):
+        for download in list(self._downloads.values()):
+            download.cancel()
+        await self._client.aclose()
@@ -0,0 +1,633 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy import (
+    Float,
+    Integer,
+    and_,
+    case,
+    create_engine,
+    delete,
+    event,
+    insert,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, sessionmaker, undefer
+
+from books.export import export
+from books.metrics import observe_io
+from books.models import Base, Book, Box, Cover, EnrichmentJob, ImportItem
+from books.search import fuzzy_score, search_key, trigrams
+
+
+logger = logging.getLogger(__name__)
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # Readers keep going while a cover is being written
+    "synchronous": "NORMAL",  # Durable enough with WAL, far fewer fsyncs
+    "busy_timeout": 5000,
+    "cache_size": -20000,  # In KiB
+    "temp_store": "MEMORY",
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# Typo-tolerant matching looks at this many trigram hits at most...
+FUZZY_CANDIDATES = 200
+# ...and keeps those whose words are at least this similar to the query
+FUZZY_THRESHOLD = 0.4
+
+
+def fts_query(keywords):
+    """Build one FTS5 MATCH expression: any keyword, each as a quoted prefix."""
+    terms = []
+    for keyword in keywords:
+        for word in search_key(keyword).split():
+            word = word.replace('"', '""')
+            terms.append(f'"{word}"*')
+    return " OR ".join(terms)
+
+
+def trigram_query(words):
+    """FTS5 MATCH expression for books_trigram: any trigram of any word."""
+    found = sorted({gram for word in words for gram in trigrams(word)})
+    return " OR ".join(f'"{gram}"' for gram in found)
+
+
+class DatabaseHandler:
+    def __init__(self, database_url):
+        self.engine = create_engine(database_url)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", set_sqlite_pragmas)
+        Base.metadata.bind = self.engine
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    def read_boxes(self):
+        boxes = []
+        with self.Session() as session:
+            boxes = session.query(Box).all()
+            session.expunge_all()
+
+        return boxes
+
+    def create_box(self, new_box_name):
+        with self.Session() as session:
+            new_box = Box(name_of_the_box=new_box_name)
+            session.add(new_box)
+            session.commit()
+
+    def create_book(self, title, isbn, author, year, description, box_id):
+        new_book = Book(
+            title=title,
+            isbn=isbn,  # TODO check the same
+            author=author,
+            year=year,
+            description=description,
+            box_id=box_id,
+        )
+        with self.Session() as session:
+            try:
+                session.add(new_book)
+                session.commit()
+
+            except IntegrityError:
+                logger.error("The book already exists, %s, %s", title, isbn)
+
+        with self.Session() as session:
+            # Retrieve the persisted instance with eager loading of 'box'
+            persisted_book = (
+                session.query(Book)
+                .options(joinedload(Book.box))
+                .filter_by(isbn=new_book.isbn)
+                .first()
+            )
+            session.expunge_all()
+
+        return persisted_book
+
+    @staticmethod
+    def _attach_cover(session, book, cover_binary, file_id=None):
+        cover_hash = hashlib.sha256(cover_binary).hexdigest()
+        cover = session.get(Cover, cover_hash)
+        if cover is None:
+            cover = Cover(sha256=cover_hash, data=cover_binary)
+            session.add(cover)
+        if file_id:
+            cover.telegram_file_id = file_id
+        book.cover_hash = cover_hash
+
+    def add_image_to_book(self, book_id, cover_binary, file_id=None):
+        with self.Session() as session:
+            book = session.get(Book, book_id)
+            if book:
+                self._attach_cover(session, book, cover_binary, file_id)
+                session.commit()
+
+    def cover_status(self, book_id):
+        """(isbn, cover_hash, enrichment pending) of a book, None if it is gone."""
+        with self.Session() as session:
+            row = session.execute(
+                select(Book.isbn, Book.cover_hash, EnrichmentJob.book_id)
+                .outerjoin(EnrichmentJob, EnrichmentJob.book_id == Book.id)
+                .where(Book.id == book_id)
+            ).first()
+        if row is None:
+            return None
+        return row[0], row[1], row[2] is not None
+
+    def shelve_isbn(self, isbn, box_id, chat_id=None, hold=0):
+        """Add a scanned ISBN to a box at once, its metadata is looked up later.
+
+        The book is stored under its ISBN with an enrichment job in the same
+        transaction, so it survives restarts and network outages. The job is
+        due after `hold` seconds, or as soon as set_enrichment_message gives
+        it the acknowledgement to edit. Returns (book, added); a book already
+        shelved is returned as it is.
+        """
+        return self.shelve_isbns([isbn], box_id, chat_id, hold)[0]
+
+    def shelve_isbns(self, isbns, box_id, chat_id=None, hold=0):
+        """shelve_isbn for several ISBNs in one transaction, (book, added) for each."""
+        with self.Session() as session:
+            known = set(session.scalars(select(Book.isbn).where(Book.isbn.in_(isbns))))
+            added = []
+            for isbn in isbns:
+                if isbn in known:
+                    continue
+                known.add(isbn)
+                book = Book(
+                    title=f"ISBN {isbn}",
+                    isbn=isbn,
+                    author="",
+                    year=0,
+                    description="",
+                    box_id=box_id,
+                )
+                session.add(book)
+                session.flush()
+                session.add(
+                    EnrichmentJob(
+                        book_id=book.id,
+                        isbn=isbn,
+                        chat_id=chat_id,
+                        next_attempt=time.time() + hold,
+                    )
+                )
+                added.append(isbn)
+            session.commit()
+            books = {
+                book.isbn: book
+                for book in session.query(Book)
+                .options(joinedload(Book.box))
+                .filter(Book.isbn.in_(isbns))
+            }
+            session.expunge_all()
+        return [(books[isbn], isbn in added) for isbn in isbns]
+
+    def set_enrichment_message(self, book_id, message_id):
+        """Record the acknowledgement to edit, which makes the job due."""
+        with self.Session() as session:
+            session.execute(
+                update(EnrichmentJob)
+                .where(EnrichmentJob.book_id == book_id)
+                .values(
+                    message_id=message_id,
+                    # A retry already scheduled keeps its backoff
+                    next_attempt=case(
+                        (EnrichmentJob.attempts == 0, time.time()),
+                        else_=EnrichmentJob.next_attempt,
+                    ),
+                )
+            )
+            session.commit()
+
+    def due_enrichments(self, now, limit=20):
+        """Enrichment jobs whose next attempt is due, oldest first."""
+        with self.Session() as session:
+            return (
+                session.query(EnrichmentJob)
+                .filter(EnrichmentJob.next_attempt <= now)
+                .order_by(EnrichmentJob.next_attempt)
+                .limit(limit)
+                .all()
+            )
+
+    def retry_enrichment(self, book_id, error, next_attempt):
+        with self.Session() as session:
+            session.execute(
+                update(EnrichmentJob)
+                .where(EnrichmentJob.book_id == book_id)
+                .values(
+                    attempts=EnrichmentJob.attempts + 1,
+                    next_attempt=next_attempt,
+                    last_error=str(error)[:500],
+                )
+            )
+            session.commit()
+
+    def finish_enrichment(self, book_id, fields=None, cover_binary=None):
+        """Drop a book's enrichment job, filling in its columns and cover if given.
+
+        A cover the user already sent is kept. Returns the book, or None if
+        it was deleted in the meantime.
+        """
+        with self.Session() as session:
+            session.execute(delete(EnrichmentJob).filter_by(book_id=book_id))
+            book = session.get(Book, book_id, options=[joinedload(Book.box)])
+            if book is not None:
+                for column, value in (fields or {}).items():
+                    setattr(book, column, value)
+                if cover_binary and book.cover_hash is None:
+                    self._attach_cover(session, book, cover_binary)
+            session.commit()
+            session.expunge_all()
+        return book
+
+    def set_cover_file_id(self, cover_hash, file_id):
+        with self.Session() as session:
+            cover = session.get(Cover, cover_hash)
+            if cover:
+                cover.telegram_file_id = file_id
+                session.commit()
+
+    def read_cover(self, cover_hash):
+        """Load a cover image, only called when it is actually going to be sent."""
+        with self.Session() as session:
+            return session.scalar(select(Cover.data).filter_by(sha256=cover_hash))
+
+    def cover_chunks(self, cover_hash, chunk_size=64 * 1024):
+        """Stream a cover with SQLite incremental blob I/O instead of loading it."""
+        if self.engine.dialect.name != "sqlite":
+            yield self.read_cover(cover_hash)
+            return
+
+        connection = self.engine.raw_connection()
+        try:
+            sqlite = connection.driver_connection
+            row = sqlite.execute(
+                "SELECT rowid FROM covers WHERE sha256 = ?", (cover_hash,)
+            ).fetchone()
+            if row is None:
+                return
+            if not hasattr(sqlite, "blobopen"):
+                # Blob I/O came with Python 3.11, older ones read slices instead
+                offset = 1
+                while True:
+                    chunk = sqlite.execute(
+                        "SELECT substr(data, ?, ?) FROM covers WHERE rowid = ?",
+                        (offset, chunk_size, row[0]),
+                    ).fetchone()
+                    if not chunk or not chunk[0]:
+                        return
+                    yield chunk[0]
+                    offset += len(chunk[0])
+            with sqlite.blobopen("covers", "data", row[0], readonly=True) as blob:
+                while chunk := blob.read(chunk_size):
+                    yield chunk
+        finally:
+            connection.close()
+
+    def search_books_by_keyword(self, *keywords, after=None, limit=None):
+        """Full-text search over title, author and description, best match first.
+
+        Keywords are turned into search keys like the stored text, so Cyrillic
+        and transliterated spellings find the same books, and all of them go
+        into a single MATCH against the books_fts index. When nothing matches
+        exactly, the trigram index is asked for near misses instead.
+        `after` is the (rank, id) cursor of the last book already shown, which
+        lets callers page through results without loading them all.
+        """
+        query = fts_query(keywords)
+        if not query:
+            return []
+
+        matches = (
+            text(
+                "SELECT rowid AS id, bm25(books_fts, 10.0, 5.0, 1.0) AS rank "
+                "FROM books_fts WHERE books_fts MATCH :query"
+            )
+            .bindparams(query=query)
+            .columns(id=Integer, rank=Float)
+            .subquery()
+        )
+        with self.Session() as session:
+            books = (
+                session.query(Book, matches.c.rank)
+                .options(joinedload(Book.box), joinedload(Book.cover))
+                .join(matches, matches.c.id == Book.id)
+                .order_by(matches.c.rank, Book.id)
+            )
+            if after:
+                rank, book_id = after
+                books = books.filter(
+                    or_(
+                        matches.c.rank > rank,
+                        and_(matches.c.rank == rank, Book.id > book_id),
+                    )
+                )
+            if limit:
+                books = books.limit(limit)
+
+            rows = books.all()
+
+        # An empty page past a cursor may also mean exact matches ran out
+        if not rows and (not after or not self._has_match(query)):
+            return self.search_books_fuzzy(*keywords, after=after, limit=limit)
+        for book, rank in rows:
+            book.rank = rank
+        return [book for book, rank in rows]
+
+    def _has_match(self, query):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                text("SELECT 1 FROM books_fts WHERE books_fts MATCH :query LIMIT 1"),
+                {"query": query},
+            ).first()
+
+    def search_books_fuzzy(self, *keywords, after=None, limit=None):
+        """Books whose title or author words are close to every keyword.
+
+        One lookup in the trigram index finds candidates sharing trigrams
+        with the keywords, which are then scored by trigram similarity. The
+        rank is the negated score, so cursors work as for exact matches.
+        """
+        words = [
+            word
+            for keyword in keywords
+            for word in search_key(keyword).split()
+            if len(word) >= 3
+        ]
+        if not words:
+            return []
+
+        with self.Session() as session:
+            ids = session.scalars(
+                text(
+                    "SELECT rowid FROM books_trigram WHERE books_trigram MATCH :query "
+                    "ORDER BY rank LIMIT :limit"
+                ).bindparams(query=trigram_query(words), limit=FUZZY_CANDIDATES)
+            ).all()
+            candidates = (
+                session.query(Book)
+                .options(
+                    joinedload(Book.box),
+                    joinedload(Book.cover),
+                    undefer(Book.title_key),
+                    undefer(Book.author_key),
+                )
+                .filter(Book.id.in_(ids))
+                .all()
+            )
+
+        books = []
+        for book in candidates:
+            score = fuzzy_score(words, f"{book.title_key} {book.author_key}")
+            if score >= FUZZY_THRESHOLD:
+                book.rank = -score
+                books.append(book)
+        books.sort(key=lambda book: (book.rank, book.id))
+        if after:
+            books = [book for book in books if (book.rank, book.id) > tuple(after)]
+        return books[:limit] if limit else books
+
+    def search_books_page(self, keywords, after=None, limit=10):
+        """Return one page of search results and the cursor of the next page."""
+        books = self.search_books_by_keyword(*keywords, after=after, limit=limit + 1)
+        if len(books) <= limit:
+            return books, None
+
+        books = books[:limit]
+        return books, (books[-1].rank, books[-1].id)
+
+    def books_in_box(self, box_name):
+        logger.info(f"Find in box named: {box_name}")
+
+        with self.Session() as session:
+            box = session.query(Box).filter_by(name_of_the_box=box_name).first()
+            if box:
+                books = session.query(Book).filter_by(box=box).all()
+                return books
+            else:
+                return []
+
+    def iter_books(self, box_name=None, batch=500):
+        """Yield every book, or those of one box, as a dict of plain values.
+
+        Rows are fetched `batch` at a time from one cursor, never all at once.
+        """
+        query = (
+            select(
+                Book.id,
+                Book.title,
+                Book.author,
+                Book.year,
+                Book.isbn,
+                Book.description,
+                Box.name_of_the_box.label("box"),
+                Book.cover_hash,
+            )
+            .outerjoin(Box, Book.box_id == Box.id)
+            .order_by(Book.id)
+            .execution_options(yield_per=batch)
+        )
+        if box_name:
+            query = query.where(Box.name_of_the_box == box_name)
+        with self.Session() as session:
+            for row in session.execute(query):
+                yield row._asdict()
+
+    def iter_cover_hashes(self, box_name=None, batch=500):
+        query = (
+            select(Book.cover_hash)
+            .distinct()
+            .where(Book.cover_hash.is_not(None))
+            .execution_options(yield_per=batch)
+        )
+        if box_name:
+            query = query.join(Box, Book.box_id == Box.id).where(
+                Box.name_of_the_box == box_name
+            )
+        with self.Session() as session:
+            yield from session.scalars(query)
+
+    def export(self, out, fmt, box_name=None):
+        """Stream the library to `out` as csv, jsonl or zip, see books.export."""
+        return export(self, out, fmt, box_name)
+
+    def start_import(self, job, items):
+        """Record the lines of an import job, unless an earlier run already did."""
+        with self.Session() as session:
+            if session.query(ImportItem).filter_by(job=job).first():
+                return False
+            session.execute(
+                insert(ImportItem), [{"job": job, **item} for item in items]
+            )
+            session.commit()
+        return True
+
+    def pending_imports(self, job, after=-1, limit=100):
+        with self.Session() as session:
+            return (
+                session.query(ImportItem)
+                .filter(
+                    ImportItem.job == job,
+                    ImportItem.status.is_(None),
+                    ImportItem.line > after,
+                )
+                .order_by(ImportItem.line)
+                .limit(limit)
+                .all()
+            )
+
+    def import_books(self, job, resolved):
+        """Insert one batch of an import job in a single transaction.
+
+        `resolved` holds (line, isbn, box_name, fields) tuples, fields being
+        None when no metadata was found. The lines are marked done in the
+        same transaction, so an interrupted import resumes where it stopped.
+        """
+        statuses, lines, books, boxes = [], [], [], {}
+        with self.Session() as session:
+            for line, isbn, box_name, fields in resolved:
+                if fields is None:
+                    statuses.append({"job": job, "line": line, "status": "missing"})
+                    continue
+                box_id = self._import_box_id(session, boxes, box_name)
+                books.append({**fields, "isbn": isbn, "box_id": box_id})
+                lines.append(line)
+
+            for line, status in zip(lines, self._insert_new_books(session, books)):
+                statuses.append({"job": job, "line": line, "status": status})
+            session.execute(update(ImportItem), statuses)
+            session.commit()
+        return [item["status"] for item in statuses]
+
+    @staticmethod
+    def _insert_new_books(session, books):
+        """Insert the books whose ISBN is not shelved yet, return a status for each."""
+        known = set(
+            session.scalars(
+                select(Book.isbn).where(Book.isbn.in_([book["isbn"] for book in books]))
+            )
+        )
+        new, statuses = [], []
+        for book in books:
+            if book["isbn"] in known:
+                statuses.append("duplicate")
+            else:
+                known.add(book["isbn"])
+                new.append(book)
+                statuses.append("added")
+        if new:
+            session.execute(insert(Book), new)
+        return statuses
+
+    def create_books(self, books):
+        """Add several books in one transaction, ISBNs already shelved are skipped.
+
+        `books` are dicts of Book columns; returns "added" or "duplicate" for each.
+        """
+        with self.Session() as session:
+            statuses = self._insert_new_books(session, books)
+            session.commit()
+        return statuses
+
+    @staticmethod
+    def _import_box_id(session, boxes, box_name):
+        if not box_name:
+            return None
+        if box_name not in boxes:
+            box = session.query(Box).filter_by(name_of_the_box=box_name).first()
+            if box is None:
+                box = Box(name_of_the_box=box_name)
+                session.add(box)
+                session.flush()
+            boxes[box_name] = box.id
+        return boxes[box_name]
+
+    def import_report(self, job):
+        """ISBNs of an import job by status, "pending" for lines not done yet."""
+        report = defaultdict(list)
+        with self.Session() as session:
+            rows = (
+                session.query(ImportItem.isbn, ImportItem.status)
+                .filter_by(job=job)
+                .order_by(ImportItem.line)
+            )
+            for isbn, status in rows:
+                report[status or "pending"].append(isbn)
+        return dict(report)
+
+
+class AsyncDatabaseHandler:
+    """Awaitable front for DatabaseHandler.
+
+    Every DatabaseHandler method is available as a coroutine that runs on a
+    worker thread, so handlers never hold the event loop while SQLite works.
+    Reads share a small pool (WAL lets them run next to a writer); writes go
+    through a single thread, as SQLite only has one writer anyway.
+    """
+
+    WRITE_METHODS = {
+        "create_box",
+        "create_book",
+        "create_books",
+        "add_image_to_book",
+        "shelve_isbn",
+        "shelve_isbns",
+        "set_enrichment_message",
+        "retry_enrichment",
+        "finish_enrichment",
+        "set_cover_file_id",
+        "start_import",
+        "import_books",
+    }
+
+    def __init__(self, db_handler, readers=4):
+        self.db_handler = db_handler
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+        self.pending = 0
+
+    @property
+    def Session(self):
+        return self.db_handler.Session
+
+    def __getattr__(self, name):
+        method = getattr(self.db_handler, name)
+        executor = self._writer if name in self.WRITE_METHODS else self._readers
+        call = f"db:{name}"
+
+        async def run(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            self.pending += 1
+            try:
+                with observe_io(call):
+                    return await loop.run_in_executor(
+                        executor, partial(method, *args, **kwargs)
+                    )
+            finally:
+                self.pending -= 1
+
+        return run
+
+    def shutdown(self):
+        self._readers.shutdown(wait=False)
+        self._writer.shutdown(wait=True)
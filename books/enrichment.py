@@ -0,0 +1,123 @@
+"""Background metadata for books shelved by barcode.
+
+A scanned ISBN is stored right away under a placeholder title with a row in
+enrichment_jobs (see DatabaseHandler.shelve_isbn). The Enricher works
+through those rows from the application's JobQueue: it looks the ISBN up,
+fills in the title, authors, year, description and cover, and edits the
+acknowledgement the user got into the result. Failed lookups are retried
+with exponential backoff, so a network outage delays a book instead of
+losing it.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+
+import httpx
+from telegram.error import TelegramError
+
+from books.metadata import book_fields, cover_url
+
+
+logger = logging.getLogger(__name__)
+
+# Attempts before a book is left under its ISBN
+MAX_ATTEMPTS = 8
+# Seconds before the first retry, doubled after each failure up to MAX_BACKOFF
+BACKOFF = 30
+MAX_BACKOFF = 3600
+NO_BOX = "no box"
+
+
+class Enricher:
+    """Looks up the metadata of queued books, a batch of due jobs at a time."""
+
+    def __init__(self, db_handler, metadata_client, covers=None, batch_size=20):
+        self.db_handler = db_handler
+        self.metadata_client = metadata_client
+        self.covers = covers
+        self.batch_size = batch_size
+        self.stats = Counter()
+        self._lock = asyncio.Lock()
+        self._again = False
+
+    async def run(self, bot):
+        """Enrich every due job, until none is left."""
+        self._again = True
+        if self._lock.locked():
+            # The running pass queries once more before it stops
+            return
+        async with self._lock:
+            while self._again:
+                self._again = False
+                while jobs := await self.db_handler.due_enrichments(
+                    time.time(), self.batch_size
+                ):
+                    await asyncio.gather(*[self.enrich(bot, job) for job in jobs])
+
+    async def enrich(self, bot, job):
+        try:
+            raw = await self.metadata_client.lookup(job.isbn)
+            fields = book_fields(raw)
+            cover = None
+            if fields and self.covers and (url := cover_url(raw)):
+                cover = await self.covers.fetch(url)
+        except httpx.HTTPError as exc:
+            await self.retry(bot, job, exc)
+            return
+        except Exception as exc:
+            # A failing job must not stay due, or the pass would never end
+            logger.exception("Enrichment of %s failed", job.isbn)
+            await self.retry(bot, job, exc)
+            return
+
+        book = await self.db_handler.finish_enrichment(job.book_id, fields, cover)
+        if book is None:
+            self.stats["deleted"] += 1
+            return
+        if fields is None:
+            self.stats["missing"] += 1
+            text = (
+                f"No info found for {job.isbn}, it stays in {book.box or NO_BOX} "
+                f"as {book.title}"
+            )
+        else:
+            self.stats["enriched"] += 1
+            text = f"Ok! i know this book, {book}"
+            if cover:
+                text += ", I found its cover too"
+        await self.notify(bot, job, text)
+
+    async def retry(self, bot, job, error):
+        if job.attempts + 1 >= MAX_ATTEMPTS:
+            self.stats["failed"] += 1
+            book = await self.db_handler.finish_enrichment(job.book_id)
+            if book is not None:
+                await self.notify(
+                    bot,
+                    job,
+                    f"Could not look up {job.isbn}, it stays in {book.box or NO_BOX} "
+                    f"as {book.title}",
+                )
+            return
+        self.stats["retried"] += 1
+        delay = min(MAX_BACKOFF, BACKOFF * 2**job.attempts)
+        logger.warning("Lookup of %s failed (%s), retry in %ds", job.isbn, error, delay)
+        await self.db_handler.retry_enrichment(job.book_id, error, time.time() + delay)
+
+    async def notify(self, bot, job, text):
+        """Edit the acknowledgement into `text`, or send it if there is none."""
+        if job.chat_id is None:
+            return
+        try:
+            if job.message_id is None:
+                await bot.send_message(job.chat_id, text)
+            else:
+                await bot.edit_message_text(
+                    text, chat_id=job.chat_id, message_id=job.message_id
+                )
+        except TelegramError as exc:
+            # Deleted message or blocked bot, the book itself is saved
+            logger.warning(
+                "Could not tell chat %s about %s: %s", job.chat_id, job.isbn, exc
+            )
@@ -0,0 +1,108 @@
+"""Streaming exports of the library, used by /export and from the command line.
+
+    python -m books.export library.zip --database sqlite:///data/books.db
+    python -m books.export box1.csv --box "Box 1"
+"""
+import argparse
+import csv
+import io
+import json
+import time
+import zipfile
+
+
+FORMATS = ("csv", "jsonl", "zip")
+COLUMNS = ["id", "title", "author", "year", "isbn", "description", "box", "cover"]
+
+
+def export_rows(db_handler, box_name=None, covers_dir=None):
+    """Yield books ready to be written, `cover` is a path in the ZIP or a hash."""
+    for book in db_handler.iter_books(box_name):
+        cover = book.pop("cover_hash")
+        if cover and covers_dir:
+            cover = f"{covers_dir}/{cover}.jpg"
+        book["cover"] = cover or ""
+        yield book
+
+
+def write_csv(rows, out):
+    writer = csv.DictWriter(out, COLUMNS)
+    writer.writeheader()
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+    return count
+
+
+def write_jsonl(rows, out):
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def _write_text(writer, rows, out):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        return writer(rows, text)
+    finally:
+        text.flush()
+        text.detach()
+
+
+def write_zip(db_handler, out, box_name=None):
+    """books.csv plus every cover once, each entry streamed into the archive."""
+    books = zipfile.ZipInfo("books.csv", date_time=time.localtime()[:6])
+    books.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(out, "w") as archive:
+        # Size is unknown up front, zip64 keeps the entry valid past 2 GiB
+        with archive.open(books, "w", force_zip64=True) as entry:
+            count = _write_text(
+                write_csv, export_rows(db_handler, box_name, "covers"), entry
+            )
+
+        # Only one entry can be open at a time, so covers get their own pass
+        for cover_hash in db_handler.iter_cover_hashes(box_name):
+            # JPEGs do not compress any further
+            with archive.open(f"covers/{cover_hash}.jpg", "w") as entry:
+                for chunk in db_handler.cover_chunks(cover_hash):
+                    entry.write(chunk)
+    return count
+
+
+def export(db_handler, out, fmt, box_name=None):
+    """Write the library, or one box, to the binary stream `out`.
+
+    Rows come from a generator and covers are read in chunks, so memory use
+    does not depend on the size of the library. Returns the number of books.
+    """
+    if fmt == "zip":
+        return write_zip(db_handler, out, box_name)
+    return _write_text(WRITERS[fmt], export_rows(db_handler, box_name), out)
+
+
+def main():
+    from books.database import DatabaseHandler
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("file", help="output file, its extension picks the format")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--box", help="export only this box")
+    parser.add_argument("--database", default="sqlite:///data/books.db")
+    args = parser.parse_args()
+
+    fmt = args.format or args.file.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        parser.error(f"unknown format {fmt}, use --format")
+
+    db_handler = DatabaseHandler(args.database)
+    with open(args.file, "wb") as out:
+        count = export(db_handler, out, fmt, args.box)
+    print(f"Exported {count} books to {args.file}")
+
+
+if __name__ == "__main__":
+    main()
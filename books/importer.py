@@ -0,0 +1,206 @@
+"""Bulk import of ISBN lists, used by /import and from the command line.
+
+    python -m books.importer isbns.csv --database sqlite:///data/books.db
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import logging
+import time
+from collections import Counter
+
+import httpx
+import isbnlib
+
+from books.cache import normalize_isbn
+from books.database import AsyncDatabaseHandler, DatabaseHandler
+from books.metadata import book_fields
+from books.providers import default_client
+
+
+logger = logging.getLogger(__name__)
+
+# Final statuses of an import line, "pending" ones are retried on the next run
+STATUSES = ("added", "duplicate", "missing", "invalid")
+LABELS = {
+    "duplicate": "Already shelved",
+    "missing": "Not found",
+    "invalid": "Not an ISBN",
+    "pending": "Lookup failed, import the file again",
+}
+
+
+def parse_isbn_list(text):
+    """Read import lines from a plain list of ISBNs or a CSV file.
+
+    An optional second column names the box, with the "Box " prefix the bot
+    uses added when it is missing. A header row is skipped and lines that
+    are not an ISBN are kept as invalid so the report can show them.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    items = []
+    for fields in csv.reader(lines, dialect):
+        fields = [field.strip() for field in fields]
+        if not fields or not fields[0]:
+            continue
+        if not items and not any(char.isdigit() for char in fields[0]):
+            continue  # Header
+
+        isbn = normalize_isbn(fields[0])
+        box_name = fields[1] if len(fields) > 1 and fields[1] else None
+        if box_name and not box_name.startswith("Box"):
+            box_name = f"Box {box_name}"
+        items.append(
+            {
+                "line": len(items),
+                "isbn": isbn,
+                "box_name": box_name,
+                "status": None if isbnlib.is_isbn13(isbn) else "invalid",
+            }
+        )
+    return items
+
+
+class Importer:
+    """Imports ISBN lists through an AsyncDatabaseHandler.
+
+    Lines are looked up batch by batch with at most `concurrency` metadata
+    requests in flight, and each batch is written in one transaction while
+    the next one is being looked up. Progress lives in the import_items
+    table keyed on the file's hash, so importing the same file again after
+    an interruption only does the lines that were not finished.
+    """
+
+    def __init__(self, db_handler, metadata_client, batch_size=100, concurrency=8):
+        self.db_handler = db_handler
+        self.metadata_client = metadata_client
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _resolve(self, item):
+        async with self._semaphore:
+            try:
+                raw = await self.metadata_client.lookup(item.isbn)
+                fields = book_fields(raw)
+            except httpx.HTTPError as exc:
+                # Stays pending, the next run tries again
+                logger.warning("Lookup of %s failed: %s", item.isbn, exc)
+                return None
+            except Exception:
+                # A bad answer for one line must not stop the whole import
+                logger.exception("Lookup of %s failed", item.isbn)
+                return None
+        return item.line, item.isbn, item.box_name, fields
+
+    async def run(self, data, progress=None, progress_interval=5):
+        """Import the raw file `data`, calling `progress(stats)` now and then."""
+        job = hashlib.sha256(data).hexdigest()
+        items = parse_isbn_list(bytes(data).decode("utf-8-sig"))
+        resumed = not await self.db_handler.start_import(job, items)
+
+        stats = Counter()
+        started = last_progress = time.perf_counter()
+        after, writing = -1, None
+        while True:
+            batch = await self.db_handler.pending_imports(
+                job, after=after, limit=self.batch_size
+            )
+            if not batch:
+                break
+            after = batch[-1].line
+
+            resolved = [
+                result
+                for result in await asyncio.gather(*map(self._resolve, batch))
+                if result
+            ]
+            if writing:
+                stats.update(await writing)
+            writing = (
+                asyncio.ensure_future(self.db_handler.import_books(job, resolved))
+                if resolved
+                else None
+            )
+            stats["processed"] += len(batch)
+            stats["pending"] += len(batch) - len(resolved)
+
+            if progress and time.perf_counter() - last_progress > progress_interval:
+                last_progress = time.perf_counter()
+                await progress(stats)
+        if writing:
+            stats.update(await writing)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "job": job,
+            "resumed": resumed,
+            "lines": len(items),
+            "processed": stats["processed"],
+            "seconds": elapsed,
+            "isbns_per_second": stats["processed"] / elapsed if elapsed else 0.0,
+            "report": await self.db_handler.import_report(job),
+        }
+
+
+def summary(result, limit=20):
+    """Human readable report of Importer.run, listing at most `limit` ISBNs each."""
+    report = result["report"]
+    counts = ", ".join(
+        f"{len(report.get(status, []))} {status}" for status in STATUSES + ("pending",)
+    )
+    lines = [
+        f"Import of {result['lines']} lines"
+        f"{' (resumed)' if result['resumed'] else ''}: {counts}",
+        f"Looked up {result['processed']} ISBNs in {result['seconds']:.1f} s, "
+        f"{result['isbns_per_second']:.1f} ISBNs/s",
+    ]
+    for status, label in LABELS.items():
+        isbns = report.get(status, [])
+        if isbns:
+            shown = isbns if limit is None else isbns[:limit]
+            more = len(isbns) - len(shown)
+            lines.append(
+                f"{label}: {', '.join(shown)}" + (f" and {more} more" if more else "")
+            )
+    return "\n".join(lines)
+
+
+async def import_file(args):
+    db_handler = AsyncDatabaseHandler(DatabaseHandler(args.database))
+    metadata_client = default_client(db_handler.Session, args.concurrency)
+
+    async def progress(stats):
+        print(f"{stats['processed']} looked up, {stats['added']} added", flush=True)
+
+    try:
+        with open(args.file, "rb") as isbn_file:
+            data = isbn_file.read()
+        importer = Importer(db_handler, metadata_client, args.batch, args.concurrency)
+        result = await importer.run(data, progress=progress)
+    finally:
+        await metadata_client.aclose()
+        db_handler.shutdown()
+    print(summary(result, limit=None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("file", help="text or CSV file: ISBN[,box name] per line")
+    parser.add_argument("--database", default="sqlite:///data/books.db")
+    parser.add_argument("--batch", type=int, default=100, help="ISBNs per transaction")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="metadata lookups in flight"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(import_file(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import re
+
+import httpx
+
+from books.metrics import observe_io
+
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_BOOKS_URL = "https://www.googleapis.com/books/v1/volumes"
+OPEN_LIBRARY_URL = "https://openlibrary.org/api/books"
+YEAR = re.compile(r"\b(1[5-9]\d\d|20\d\d)\b")
+NO_MATCH = {"kind": "books#volumes", "totalItems": 0}
+
+
+def volume_response(volume):
+    """A Google Books response with the single volume given."""
+    return {"kind": "books#volumes", "totalItems": 1, "items": [{"volumeInfo": volume}]}
+
+
+def book_fields(raw):
+    """Book columns from a Google Books response, None unless it has one match."""
+    if raw.get("totalItems") != 1:
+        return None
+    item = raw["items"][0]["volumeInfo"]
+    published = item.get("publishedDate", "")
+    return {
+        "title": item["title"],
+        "author": ",".join(item.get("authors", list())),
+        "year": int(published[:4]) if published[:4].isdigit() else 0,
+        "description": item.get("description", ""),
+    }
+
+
+def cover_url(raw):
+    """Largest cover image a single-match response links to, or None."""
+    if raw.get("totalItems") != 1:
+        return None
+    links = raw["items"][0]["volumeInfo"].get("imageLinks", {})
+    for size in ("large", "medium", "small", "thumbnail", "smallThumbnail"):
+        if links.get(size):
+            # Google links plain http and draws a page curl on the image
+            url = links[size].replace("&edge=curl", "")
+            if url.startswith("http://books.google."):
+                url = "https://" + url[len("http://") :]
+            return url
+    return None
+
+
+class MetadataClient:
+    """Async Google Books client with a shared keep-alive connection pool.
+
+    One instance is meant to live as long as the bot: the underlying
+    httpx.AsyncClient keeps TLS connections open between lookups, every
+    request is bounded by a timeout, at most `max_concurrency` lookups hit
+    the API at once and transient failures are retried with backoff.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    name = "google"
+
+    def __init__(
+        self,
+        base_url=GOOGLE_BOOKS_URL,
+        timeout=5.0,
+        max_connections=10,
+        max_concurrency=4,
+        retries=3,
+        backoff=0.5,
+        country="RU",
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.country = country
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    def params(self, isbn):
+        params = {"q": f"isbn:{isbn}"}
+        if self.country:
+            params["country"] = self.country
+        return params
+
+    def parse(self, isbn, data):
+        return data
+
+    async def lookup(self, isbn):
+        """Return the raw Google Books response for the given ISBN."""
+        params = self.params(isbn)
+        for attempt in range(self.retries + 1):
+            try:
+                # Held per request, a lookup waiting to retry leaves the slot free
+                async with self._semaphore:
+                    with observe_io(f"isbn_api:{self.name}"):
+                        response = await self._client.get(self.base_url, params=params)
+                if response.status_code not in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                    return self.parse(isbn, response.json())
+                error = httpx.HTTPStatusError(
+                    f"Retryable status {response.status_code}",
+                    request=response.request,
+                    response=response,
+                )
+                retry_after = response.headers.get("Retry-After", "")
+            except httpx.TransportError as exc:
+                error = exc
+                retry_after = ""
+
+            if attempt == self.retries:
+                raise error
+
+            delay = self.backoff * 2**attempt
+            if retry_after.isdigit():
+                # Waiting longer than a request may take is not worth it
+                delay = max(delay, min(int(retry_after), self.timeout))
+            logger.warning(
+                "Lookup of %s failed (%s), retry in %.1fs", isbn, error, delay
+            )
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class OpenLibraryClient(MetadataClient):
+    """Open Library books API, answers reshaped like Google Books responses.
+
+    Same pool, retries and concurrency limit as MetadataClient; only the
+    query and the parsing differ. Open Library often has no description
+    but tends to know older and Russian editions Google Books misses.
+    """
+
+    name = "openlibrary"
+
+    def __init__(self, base_url=OPEN_LIBRARY_URL, **kwargs):
+        super().__init__(base_url=base_url, country=None, **kwargs)
+
+    def params(self, isbn):
+        return {"bibkeys": f"ISBN:{isbn}", "format": "json", "jscmd": "data"}
+
+    def parse(self, isbn, data):
+        record = data.get(f"ISBN:{isbn}")
+        if not record or not record.get("title"):
+            return NO_MATCH
+        volume = {
+            "title": record["title"],
+            "authors": [
+                author["name"]
+                for author in record.get("authors", [])
+                if author.get("name")
+            ],
+            "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn}],
+        }
+        year = YEAR.search(record.get("publish_date", ""))
+        if year:
+            volume["publishedDate"] = year.group(1)
+        notes = record.get("notes")
+        if isinstance(notes, dict):
+            notes = notes.get("value")
+        if isinstance(notes, str) and notes:
+            volume["description"] = notes
+        cover = record.get("cover", {})
+        if cover.get("medium") or cover.get("large"):
+            volume["imageLinks"] = {
+                "thumbnail": cover.get("medium") or cover.get("large"),
+            }
+        return volume_response(volume)
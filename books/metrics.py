@@ -0,0 +1,299 @@
+import asyncio
+import bisect
+import logging
+import time
+from functools import wraps
+
+from telegram.ext import ConversationHandler
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cache hit to a slow barcode decode or flood wait
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    """A value set by the code, or read from `func` at scrape time.
+
+    `func` returns a number, or a mapping from label value to number when the
+    gauge has one label; `kind` can say "counter" for totals kept elsewhere,
+    like the stats Counters of the cache and the send scheduler.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), func=None, kind=None):
+        super().__init__(name, help, labels)
+        self.func = func
+        if kind:
+            self.kind = kind
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.func is None:
+            yield from super().samples()
+            return
+        value = self.func()
+        if isinstance(value, dict):
+            for label, number in value.items():
+                yield self.name, _labels(self.labelnames, (label,)), number
+        else:
+            yield self.name, "", value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(
+                    self.labelnames, labels, [("le", bound)]
+                ), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _labels(self.labelnames, labels), cumulative
+
+
+class Timer:
+    """Observe the duration of a block, and count it as an error if it raises."""
+
+    __slots__ = ("histogram", "errors", "labels", "started")
+
+    def __init__(self, histogram, errors, *labels):
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        # Cancellation is how superseded work ends, not a failure
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.errors.inc(*self.labels)
+        return False
+
+
+class Registry:
+    """Metrics by name, rendered in the Prometheus text format.
+
+    Everything is updated from the event loop, so there are no locks on the
+    hot path; an observation is a dict lookup and a bisect.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        # A later instance (a new bot in the same process) takes over the name
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), func=None, kind=None):
+        return self.register(Gauge(name, help, labels, func, kind))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {value}")
+            except Exception:
+                logger.exception("Could not collect %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bookshelf_handler_seconds", "Time spent in each bot handler", ["handler"]
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bookshelf_handler_errors_total",
+    "Exceptions raised by each bot handler",
+    ["handler"],
+)
+IO_SECONDS = REGISTRY.histogram(
+    "bookshelf_io_seconds",
+    "Latency of metadata lookups, barcode decoding, database and Telegram calls",
+    ["call"],
+)
+IO_ERRORS = REGISTRY.counter(
+    "bookshelf_io_errors_total",
+    "Failed metadata, decoder, database and Telegram calls",
+    ["call"],
+)
+UPDATES_IN_FLIGHT = REGISTRY.gauge(
+    "bookshelf_updates_in_flight", "Updates being processed or waiting for their user"
+)
+PROVIDER_SECONDS = REGISTRY.histogram(
+    "bookshelf_provider_seconds",
+    "Time until each metadata provider answered, deadline included",
+    ["provider"],
+)
+PROVIDER_RESULTS = REGISTRY.counter(
+    "bookshelf_provider_results_total",
+    "Metadata provider outcomes: hit, partial, miss, timeout, error, "
+    "cancelled once another answered, or hedged when never asked",
+    ["provider", "result"],
+)
+
+
+def observe_io(call):
+    return Timer(IO_SECONDS, IO_ERRORS, call)
+
+
+def instrument_handlers(application):
+    """Time the callback of every registered handler, conversation states included."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument(handler)
+
+
+def _instrument(handler):
+    if isinstance(handler, ConversationHandler):
+        for state in [
+            handler.entry_points,
+            *handler.states.values(),
+            handler.fallbacks,
+        ]:
+            for inner in state:
+                _instrument(inner)
+        return
+
+    callback = handler.callback
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @wraps(callback)
+    async def timed(update, context):
+        with Timer(HANDLER_SECONDS, HANDLER_ERRORS, name):
+            return await callback(update, context)
+
+    handler.callback = timed
+
+
+class MetricsServer:
+    """Serves a registry on GET /metrics for Prometheus to scrape."""
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass  # Headers are not needed
+
+            parts = request.decode("latin-1").split()
+            if (
+                len(parts) >= 2
+                and parts[0] == "GET"
+                and parts[1].split("?")[0]
+                in (
+                    "/metrics",
+                    "/",
+                )
+            ):
+                status = "200 OK"
+                body = self.registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -1,12 +1,18 @@
 # books/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, ForeignKey, LargeBinary, Boolean, Float, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy import UniqueConstraint, DDL, event, inspect
+
+from books.search import book_keys, search_key
 
 
 Base = declarative_base()
 
+def _key(context, column):
+    # Called per row, executemany inserts included
+    return search_key(context.get_current_parameters().get(column))
+
 class Box(Base):
     __tablename__ = 'boxes'
 
@@ -26,7 +32,14 @@ class Book(Base):
     author = Column(String, nullable=False)
     year = Column(Integer, nullable=False)
     description = Column(String)
-    cover = Column(LargeBinary)
+    # Normalized Latin forms of the text above, filled in on insert for the indexes
+    title_key = deferred(Column(String, default=lambda context: _key(context, 'title')))
+    author_key = deferred(Column(String, default=lambda context: _key(context, 'author')))
+    description_key = deferred(
+        Column(String, default=lambda context: _key(context, 'description'))
+    )
+    cover_hash = Column(String, ForeignKey('covers.sha256'))  # Image lives in covers
+    cover = relationship('Cover')
     box_id = Column(Integer, ForeignKey('boxes.id', ondelete='CASCADE'))
     box = relationship('Box', back_populates='books')
 
@@ -35,3 +48,181 @@ class Book(Base):
 
     def __str__(self):
         return f"{self.title}, {self.isbn}, {self.author}, {self.box}"
+
+class Cover(Base):
+    __tablename__ = 'covers'
+
+    # Content-addressed: the same image is stored once however many books use it
+    sha256 = Column(String, primary_key=True)
+    data = deferred(Column(LargeBinary, nullable=False))  # Loaded only when uploading
+    telegram_file_id = Column(String)  # Reused instead of uploading the image again
+
+    def __str__(self):
+        return f"{self.sha256}"
+
+class IsbnLookup(Base):
+    __tablename__ = 'isbn_lookups'
+
+    isbn = Column(String, primary_key=True)  # Normalized ISBN-13
+    found = Column(Boolean, nullable=False)
+    payload = Column(Text, nullable=False)  # Raw metadata response as JSON
+    fetched_at = Column(Float, nullable=False)
+
+    def __str__(self):
+        return f"{self.isbn}, {'hit' if self.found else 'miss'}"
+
+class CatalogEdition(Base):
+    __tablename__ = 'isbn_catalog'
+
+    # One row per ISBN-13 of a bulk dump edition, looked up before the network
+    isbn = Column(String, primary_key=True)
+    title = Column(String, nullable=False)
+    author_keys = Column(String)  # Space separated keys into catalog_authors
+    by_statement = Column(String)  # Authors as printed, when keys are missing
+    year = Column(Integer)
+    description = Column(Text)
+    cover_id = Column(Integer)  # Open Library cover image, see catalog.COVER_URL
+    source_key = Column(String)  # Edition key in the dump, e.g. /books/OL1M
+    last_modified = Column(String, nullable=False)  # ISO timestamp from the dump
+
+    # The primary key is the only index, without a rowid the table stays compact
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __str__(self):
+        return f"{self.isbn}, {self.title}"
+
+class CatalogAuthor(Base):
+    __tablename__ = 'catalog_authors'
+
+    key = Column(String, primary_key=True)  # e.g. /authors/OL1A
+    name = Column(String, nullable=False)
+    last_modified = Column(String, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __str__(self):
+        return f"{self.key}, {self.name}"
+
+class EnrichmentJob(Base):
+    __tablename__ = 'enrichment_jobs'
+
+    # One pending metadata lookup per book shelved by barcode, deleted once done
+    book_id = Column(Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    isbn = Column(String, nullable=False)
+    chat_id = Column(Integer)  # Where the acknowledgement was sent...
+    message_id = Column(Integer)  # ...and edited when the lookup finishes
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt = Column(Float, nullable=False, index=True)  # Unix time
+    last_error = Column(String)
+
+    def __str__(self):
+        return f"{self.book_id}, {self.isbn}, {self.attempts} attempts"
+
+class ConversationEntry(Base):
+    __tablename__ = 'conversation_state'
+
+    # One row per user, chat or conversation key, so a flush rewrites only what changed
+    kind = Column(String, primary_key=True)  # user, chat, bot or conversation:<name>
+    key = Column(String, primary_key=True)  # JSON encoded id or conversation key
+    data = Column(Text, nullable=False)  # JSON
+
+    def __str__(self):
+        return f"{self.kind}, {self.key}"
+
+class ImportItem(Base):
+    __tablename__ = 'import_items'
+
+    # A job is identified by the hash of its file, so importing it again resumes
+    job = Column(String, primary_key=True)
+    line = Column(Integer, primary_key=True)
+    isbn = Column(String, nullable=False)  # Normalized ISBN-13 or the raw text
+    box_name = Column(String)
+    status = Column(String)  # None until done: added, duplicate, missing or invalid
+
+    def __str__(self):
+        return f"{self.job[:8]}:{self.line}, {self.isbn}, {self.status}"
+
+
+# Full-text index over the search keys, kept in sync with the books table by triggers
+BOOKS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title_key, author_key, description_key,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title_key, author_key, description_key)
+        VALUES (new.id, new.title_key, new.author_key, new.description_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title_key, author_key, description_key)
+        VALUES ('delete', old.id, old.title_key, old.author_key, old.description_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au
+    AFTER UPDATE OF title_key, author_key, description_key ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title_key, author_key, description_key)
+        VALUES ('delete', old.id, old.title_key, old.author_key, old.description_key);
+        INSERT INTO books_fts(rowid, title_key, author_key, description_key)
+        VALUES (new.id, new.title_key, new.author_key, new.description_key);
+    END""",
+]
+
+# Trigram index over title and author keys, for typo-tolerant matching
+BOOKS_TRIGRAM_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_trigram USING fts5(
+        title_key, author_key,
+        content='books', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_trigram_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_trigram(rowid, title_key, author_key)
+        VALUES (new.id, new.title_key, new.author_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_trigram_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_trigram(books_trigram, rowid, title_key, author_key)
+        VALUES ('delete', old.id, old.title_key, old.author_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_trigram_au
+    AFTER UPDATE OF title_key, author_key ON books BEGIN
+        INSERT INTO books_trigram(books_trigram, rowid, title_key, author_key)
+        VALUES ('delete', old.id, old.title_key, old.author_key);
+        INSERT INTO books_trigram(rowid, title_key, author_key)
+        VALUES (new.id, new.title_key, new.author_key);
+    END""",
+]
+
+# The index as it was over the raw text, which older migrations recreate
+BOOKS_FTS_DDL_V1 = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au
+    AFTER UPDATE OF title, author, description ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END""",
+]
+
+for statement in BOOKS_FTS_DDL + BOOKS_TRIGRAM_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement))
+
+
+@event.listens_for(Book, 'before_update')
+def _update_keys(mapper, connection, book):
+    # ORM edits of the text refresh its keys, inserts get them from the defaults
+    state = inspect(book)
+    if any(state.attrs[column].history.has_changes() for column in ('title', 'author', 'description')):
+        for column, value in book_keys(book.title, book.author, book.description).items():
+            setattr(book, column, value)
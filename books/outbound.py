@@ -0,0 +1,297 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import itertools
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import wraps
+
+from telegram.error import NetworkError, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from books.metrics import observe_io
+
+
+logger = logging.getLogger(__name__)
+
+# Lower value is sent first
+REPLY, BULK = 0, 1
+
+_priority = contextvars.ContextVar("outbound_priority", default=REPLY)
+
+# Only calls that post into a chat count against Telegram's flood limits
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+MESSAGE_LIMIT = 4096
+
+
+def bulk_output(func):
+    """Mark everything a handler sends as bulk, so conversation replies go first."""
+
+    @wraps(func)
+    async def wrapped(*args, **kwargs):
+        token = _priority.set(BULK)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _priority.reset(token)
+
+    return wrapped
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+@dataclass(order=True)
+class _Request:
+    priority: int
+    seq: int
+    chat_id: object = field(compare=False)
+    endpoint: str = field(compare=False)
+    data: dict = field(compare=False)
+    ready: asyncio.Future = field(compare=False, default=None)
+    result: asyncio.Future = field(compare=False, default=None)
+    merged: int = field(compare=False, default=0)
+
+
+class SendScheduler(BaseRateLimiter):
+    """Central outbound queue for everything the bot sends.
+
+    Plugged in as the Application's rate limiter, so every reply_text,
+    reply_photo or send_message goes through it. Requests wait for a token
+    from the global bucket and from their chat's bucket, conversation replies
+    overtake bulk output (see bulk_output), consecutive plain texts queued for
+    the same chat are merged into one message and RetryAfter pauses sending
+    for the time Telegram asks for before the request is retried.
+    """
+
+    def __init__(
+        self,
+        global_rate=30,
+        private_rate=1,
+        group_rate=20 / 60,
+        burst=3,
+        global_burst=5,
+        max_retries=3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.stats = Counter()
+        self._chats = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+        self._handoffs = set()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    async def initialize(self) -> None:
+        # ExtBot initializes its rate limiter again for every caller
+        if self._dispatcher:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._dispatcher
+            self._dispatcher = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                # Forget chats whose bucket has refilled, they start full anyway
+                now = time.monotonic()
+                self._chats = {
+                    key: value
+                    for key, value in self._chats.items()
+                    if value.wait_time(now) or value.tokens < value.capacity
+                }
+            is_group = isinstance(chat_id, str) or (chat_id or 0) < 0
+            rate = self.group_rate if is_group else self.private_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def _enqueue(self, request):
+        request.ready = asyncio.get_running_loop().create_future()
+        # Still queued when handed off right after its caller was cancelled
+        if request not in self._queue:
+            bisect.insort(self._queue, request)
+        self._wakeup.set()
+
+    def _coalesce(self, chat_id, data):
+        """Append a plain text to the last message still queued for the chat."""
+        if data.get("reply_markup") is not None:
+            return None
+        for queued in reversed(self._queue):
+            if queued.chat_id != chat_id or queued.ready.done():
+                # A done `ready` is a caller cancelled before its turn
+                continue
+            if queued.endpoint != "sendMessage" or queued.data.keys() != data.keys():
+                return None
+            if queued.data.get("reply_markup") is not None or any(
+                queued.data[key] != value
+                for key, value in data.items()
+                if key != "text"
+            ):
+                return None
+            text = f"{queued.data['text']}\n\n{data['text']}"
+            if len(text) > MESSAGE_LIMIT:
+                return None
+            queued.data["text"] = text
+            queued.merged += 1
+            return queued
+        return None
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            # Drop requests whose sender was cancelled while waiting
+            self._queue = [
+                request for request in self._queue if not request.ready.done()
+            ]
+            if not self._queue:
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self.global_bucket.wait_time(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            earliest = None
+            for request in self._queue:
+                wait = self._chat_bucket(request.chat_id).wait_time(now)
+                if wait == 0:
+                    self._queue.remove(request)
+                    self.global_bucket.take()
+                    self._chat_bucket(request.chat_id).take()
+                    request.ready.set_result(None)
+                    break
+                earliest = wait if earliest is None else min(earliest, wait)
+            else:
+                # Every queued chat is throttled, sleep until one frees up or
+                # a request for another chat arrives
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), earliest)
+                except asyncio.TimeoutError:
+                    pass
+            await asyncio.sleep(0)
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        call = f"telegram:{endpoint}"
+        if not endpoint.startswith(LIMITED_PREFIXES) or self._dispatcher is None:
+            with observe_io(call):
+                return await callback(*args, **kwargs)
+
+        chat_id = data.get("chat_id")
+        if endpoint == "sendMessage":
+            queued = self._coalesce(chat_id, data)
+            if queued:
+                self.stats["coalesced"] += 1
+                return await asyncio.shield(queued.result)
+
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else None
+        request = _Request(
+            priority=_priority.get() if priority is None else priority,
+            seq=next(self._seq),
+            chat_id=chat_id,
+            endpoint=endpoint,
+            data=data,
+        )
+        request.result = asyncio.get_running_loop().create_future()
+        try:
+            return await self._send(request, call, callback, args, kwargs)
+        except asyncio.CancelledError:
+            if request.merged and not request.result.done():
+                self._hand_off(request, call, callback, args, kwargs)
+            raise
+
+    async def _send(self, request, call, callback, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._enqueue(request)
+            await request.ready
+            try:
+                with observe_io(call):
+                    result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                self.stats["retry_after"] += 1
+                self._paused_until = time.monotonic() + exc.retry_after
+                logger.warning(
+                    "Flood limit hit on %s, pausing for %ss",
+                    request.endpoint,
+                    exc.retry_after,
+                )
+                if attempt == self.max_retries:
+                    self._fail(request, exc)
+                    raise
+            except Exception as exc:
+                self._fail(request, exc)
+                raise
+            else:
+                self.stats["sent"] += 1
+                request.result.set_result(result)
+                return result
+
+    def _hand_off(self, request, call, callback, args, kwargs):
+        """Send a cancelled caller's message for the callers merged into it.
+
+        They are usually handlers holding their user's lock while they wait,
+        without this the whole session would hang.
+        """
+        if self._dispatcher is None:
+            self._fail(request, NetworkError("The send queue has been shut down"))
+            return
+        self.stats["handed_off"] += 1
+        task = asyncio.get_running_loop().create_task(
+            self._send_for_followers(request, call, callback, args, kwargs)
+        )
+        self._handoffs.add(task)
+        task.add_done_callback(self._handoffs.discard)
+
+    async def _send_for_followers(self, request, call, callback, args, kwargs):
+        try:
+            await self._send(request, call, callback, args, kwargs)
+        except asyncio.CancelledError:
+            self._fail(request, NetworkError("Sending the message was cancelled"))
+            raise
+        except Exception:
+            pass  # Already passed on to the followers by _fail
+
+    @staticmethod
+    def _fail(request, exc):
+        if request.result.done():
+            return
+        # Only coalesced callers are waiting on the shared result
+        if request.merged:
+            request.result.set_exception(exc)
+        else:
+            request.result.cancel()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from books.models import ConversationEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+
+class DatabasePersistence(BasePersistence):
+    """Bot persistence stored in the books database.
+
+    PicklePersistence rewrites a single file with everybody's state on every
+    flush. Here every user, chat and conversation key is its own JSON row in
+    `conversation_state`, and a row is written only when its encoding
+    differs from what was last stored, so a flush costs as much as the
+    number of sessions that changed, not the number of users. Changes handed
+    over at the same time go out in one transaction. Arbitrary callback data
+    is not stored, the bot does not use it.
+    """
+
+    def __init__(self, session_factory, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self.Session = session_factory
+        self.stats = Counter()
+        self._stored = {}  # (kind, key) -> JSON last written
+        self._pending = {}  # (kind, key) -> JSON, None deletes the row
+        self._lock = asyncio.Lock()
+
+    def load(self, kind):
+        with self.Session() as session:
+            rows = session.query(ConversationEntry).filter_by(kind=kind).all()
+        for row in rows:
+            self._stored[(kind, row.key)] = row.data
+        return {row.key: json.loads(row.data) for row in rows}
+
+    def write(self, changes):
+        with self.Session() as session:
+            for (kind, key), data in changes.items():
+                if data is None:
+                    session.query(ConversationEntry).filter_by(
+                        kind=kind, key=key
+                    ).delete()
+                else:
+                    session.merge(ConversationEntry(kind=kind, key=key, data=data))
+            session.commit()
+
+    async def _save(self, kind, key, data):
+        if self._stored.get((kind, key)) == data:
+            self.stats["unchanged"] += 1
+            return
+        self._pending[(kind, key)] = data
+        await self._write_pending()
+
+    async def _write_pending(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self.write, changes)
+            except Exception:
+                # Keep them for the next flush, unless they were changed meanwhile
+                self._pending = {**changes, **self._pending}
+                raise
+            for entry, data in changes.items():
+                if data is None:
+                    self._stored.pop(entry, None)
+                else:
+                    self._stored[entry] = data
+            self.stats["written"] += len(changes)
+            self.stats["transactions"] += 1
+
+    async def _save_data(self, kind, key, data):
+        # Users and chats that never stored anything get no row
+        await self._save(kind, key, _encode(data) if data else None)
+
+    async def get_user_data(self):
+        loaded = await asyncio.to_thread(self.load, "user")
+        return {int(key): data for key, data in loaded.items()}
+
+    async def get_chat_data(self):
+        loaded = await asyncio.to_thread(self.load, "chat")
+        return {int(key): data for key, data in loaded.items()}
+
+    async def get_bot_data(self):
+        loaded = await asyncio.to_thread(self.load, "bot")
+        return loaded.get("", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        loaded = await asyncio.to_thread(self.load, f"conversation:{name}")
+        return {tuple(json.loads(key)): state for key, state in loaded.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        await self._save(
+            f"conversation:{name}",
+            _encode(list(key)),
+            None if new_state is None else _encode(new_state),
+        )
+
+    async def update_user_data(self, user_id, data):
+        await self._save_data("user", str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self._save_data("chat", str(chat_id), data)
+
+    async def update_bot_data(self, data):
+        await self._save_data("bot", "", data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self._save("user", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        await self._save("chat", str(chat_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await self._write_pending()
+        logger.info("Conversation state flushed, stats: %s", dict(self.stats))
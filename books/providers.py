@@ -0,0 +1,204 @@
+"""Hedged metadata lookups across several providers.
+
+Google Books answers most scans quickly but misses many Russian and older
+editions, Open Library knows more of those but is slower and rarely has a
+description. Instead of asking one and then the other, HedgedResolver asks
+them together: each provider starts after its own delay (or as soon as an
+earlier one came back empty handed) and gets its own deadline. The first
+complete answer wins and the others are cancelled; when nobody has a
+complete record, the partial ones are merged field by field.
+
+The local catalog and the lookup cache still sit in front, they answer in
+well under a millisecond and only misses reach the resolver:
+
+    IsbnCatalog -> IsbnCache -> HedgedResolver(Google Books, Open Library)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import httpx
+
+from books.cache import IsbnCache
+from books.catalog import IsbnCatalog
+from books.metadata import (
+    GOOGLE_BOOKS_URL,
+    NO_MATCH,
+    OPEN_LIBRARY_URL,
+    MetadataClient,
+    OpenLibraryClient,
+    volume_response,
+)
+from books.metrics import PROVIDER_RESULTS, PROVIDER_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+# What a book needs to be saved without asking anyone else
+COMPLETE_FIELDS = ("title", "authors", "publishedDate")
+
+
+@dataclass
+class Provider:
+    """A metadata client with its hedging delay and deadline, in seconds."""
+
+    client: object
+    deadline: float = 3.0
+    delay: float = 0.0
+
+    @property
+    def name(self):
+        return getattr(self.client, "name", type(self.client).__name__)
+
+
+def volume_fields(raw):
+    """The non-empty volumeInfo fields of a single-match response."""
+    if raw.get("totalItems") != 1:
+        return {}
+    volume = raw["items"][0].get("volumeInfo", {})
+    return {key: value for key, value in volume.items() if value}
+
+
+class HedgedResolver:
+    """Metadata client that asks several providers and merges their answers.
+
+    Same contract as MetadataClient: lookup() returns a Google Books shaped
+    response, with an extra "sources" key naming the provider of each
+    field. It raises the last provider error when a provider failed and
+    none of the others had the book, so callers keep telling misses from
+    outages and retry instead of caching a miss.
+    """
+
+    def __init__(self, providers, complete=COMPLETE_FIELDS):
+        self.providers = providers
+        self.complete = complete
+        self.stats = Counter()
+
+    def _record(self, provider, result, started=None):
+        self.stats[f"{provider.name}_{result}"] += 1
+        PROVIDER_RESULTS.inc(provider.name, result)
+        if started is not None:
+            PROVIDER_SECONDS.observe(time.perf_counter() - started, provider.name)
+
+    def is_complete(self, fields):
+        return all(fields.get(key) for key in self.complete)
+
+    async def _ask(self, provider, isbn, escalate):
+        if provider.delay:
+            try:
+                await asyncio.wait_for(escalate.wait(), provider.delay)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Someone answered before this provider was needed
+                self._record(provider, "hedged")
+                raise
+
+        started = time.perf_counter()
+        try:
+            raw = await asyncio.wait_for(
+                provider.client.lookup(isbn), provider.deadline
+            )
+        except asyncio.CancelledError:
+            self._record(provider, "cancelled")
+            raise
+        except asyncio.TimeoutError:
+            self._record(provider, "timeout", started)
+            raise httpx.TimeoutException(
+                f"{provider.name} did not answer within {provider.deadline}s"
+            )
+        except httpx.HTTPError:
+            self._record(provider, "error", started)
+            raise
+
+        fields = volume_fields(raw)
+        if not fields:
+            result = "miss"
+        else:
+            result = "hit" if self.is_complete(fields) else "partial"
+        self._record(provider, result, started)
+        return fields
+
+    async def lookup(self, isbn):
+        escalate = asyncio.Event()
+        tasks = {
+            asyncio.ensure_future(self._ask(provider, isbn, escalate)): provider
+            for provider in self.providers
+        }
+        answers, errors, winner = {}, [], None
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    provider = tasks[task]
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        escalate.set()
+                        continue
+                    answers[provider.name] = task.result()
+                    if self.is_complete(task.result()):
+                        winner = winner or provider.name
+                    else:
+                        escalate.set()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+        # The winner's record first, then the others in order of preference
+        order = [winner] if winner else []
+        order += [
+            provider.name for provider in self.providers if provider.name in answers
+        ]
+        volume, sources = {}, {}
+        for name in order:
+            for key, value in answers[name].items():
+                if key not in volume:
+                    volume[key] = value
+                    sources[key] = name
+        if not volume.get("title"):
+            if errors:
+                # A provider that failed may know the book, this is not a miss
+                raise errors[-1]
+            return NO_MATCH
+        return {**volume_response(volume), "sources": sources}
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.client.aclose()
+
+
+def default_client(session_factory, max_concurrency=4):
+    """Catalog, then cache, then Google Books hedged with Open Library.
+
+    Open Library is only asked when Google Books has not answered within
+    OPEN_LIBRARY_DELAY seconds or came back without a complete record.
+    """
+    deadline = float(os.environ.get("PROVIDER_DEADLINE", 3.0))
+    resolver = HedgedResolver(
+        [
+            Provider(
+                MetadataClient(
+                    base_url=os.environ.get("ISBN_API_URL", GOOGLE_BOOKS_URL),
+                    max_concurrency=max_concurrency,
+                ),
+                deadline=deadline,
+            ),
+            Provider(
+                OpenLibraryClient(
+                    base_url=os.environ.get("OPEN_LIBRARY_URL", OPEN_LIBRARY_URL),
+                    max_concurrency=max_concurrency,
+                ),
+                deadline=deadline,
+                delay=float(os.environ.get("OPEN_LIBRARY_DELAY", 0.5)),
+            ),
+        ]
+    )
+    return IsbnCatalog(session_factory, IsbnCache(session_factory, resolver))
@@ -0,0 +1,58 @@
+"""Search keys shared by stored books and incoming queries.
+
+Text is casefolded, Cyrillic is transliterated to Latin and accents and
+punctuation are dropped, so "Преступление", "prestuplenie" and "Prestuplénie"
+all become the same key. Books store their keys next to the original text,
+queries get the same treatment, and one lookup covers both scripts.
+"""
+import re
+import unicodedata
+
+from transliterate import translit
+
+
+_CYRILLIC = re.compile("[а-яё]")
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+def search_key(text):
+    """Normalized Latin form of `text`, words separated by single spaces."""
+    text = (text or "").casefold().replace("ё", "е")
+    if _CYRILLIC.search(text):
+        # Soft and hard signs come out as apostrophes, which would split the word
+        text = text.replace("ь", "").replace("ъ", "")
+        text = translit(text, "ru", reversed=True)
+    # Decompose after transliterating, or й would lose its breve and become и
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_NOT_WORD.sub(" ", text).split())
+
+
+def book_keys(title, author, description):
+    return {
+        "title_key": search_key(title),
+        "author_key": search_key(author),
+        "description_key": search_key(description),
+    }
+
+
+def trigrams(word):
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+def similarity(first, second):
+    """Share of trigrams two words have in common, 1.0 for the same word."""
+    first, second = trigrams(first), trigrams(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def fuzzy_score(words, text):
+    """How well every query word matches its closest word of `text`, 0 to 1."""
+    candidates = text.split()
+    if not words or not candidates:
+        return 0.0
+    return sum(
+        max(similarity(word, candidate) for candidate in candidates) for word in words
+    ) / len(words)
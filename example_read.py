@@ -2,7 +2,11 @@ import sqlite3
 
 def save_cover_to_file(book_id, output_file_path, cursor):
     # Assuming 'books' is your table name
-    cursor.execute("SELECT cover FROM books WHERE id=?", (book_id,))
+    # Covers are stored once per image in 'covers', books point at them by hash
+    cursor.execute(
+        "SELECT data FROM covers JOIN books ON books.cover_hash = covers.sha256 WHERE books.id=?",
+        (book_id,),
+    )
     cover_data = cursor.fetchone()
 
     if cover_data: